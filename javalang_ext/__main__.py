@@ -0,0 +1,45 @@
+import argparse
+import sys
+
+from . import batch
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m javalang_ext')
+    commands = parser.add_subparsers(dest='command')
+
+    parse_command = commands.add_parser(
+        'parse', help='parse Java files and directories of Java files')
+    parse_command.add_argument('paths', nargs='+', metavar='PATH')
+    parse_command.add_argument('-j', '--workers', type=int, default=None,
+                               help='number of worker processes')
+    parse_command.add_argument('--outline', action='store_true',
+                               help='only parse declarations')
+    parse_command.add_argument('-v', '--verbose', action='store_true',
+                               help='list files which parsed as well')
+
+    args = parser.parse_args(argv)
+
+    if args.command is None:
+        parser.print_usage()
+        return 2
+
+    files = 0
+    failures = 0
+
+    # Only the type names come back from the workers, not the trees
+    for result in batch.map_files(args.paths, batch.type_names, args.workers,
+                                  args.outline):
+        files += 1
+
+        if result.error is not None:
+            failures += 1
+            print('%s: %s' % (result.path, result.error))
+        elif args.verbose:
+            print('%s: %s' % (result.path, ', '.join(result.value)))
+
+    print('%d files parsed, %d failed' % (files, failures))
+
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,23 @@
-import pickle
+import bisect
+import heapq
 
 import six
 
+from .tokenizer import Position
+
+# Slots which are not part of a node's state, so are neither pickled nor
+# serialized
+_TRANSIENT_SLOTS = frozenset(('_deferred', '_index'))
+
+# Caches for contained_classes() and barren_classes(), emptied as classes are
+# added
+_contained = dict()
+_barren = dict()
 
 class MetaNode(type):
+    # Node classes by module and name, the only classes load() creates
+    classes = dict()
+
     def __new__(mcs, name, bases, dict):
         attrs = list(dict['attrs'])
         dict['attrs'] = list()
@@ -14,23 +28,200 @@ class MetaNode(type):
 
         dict['attrs'].extend(attrs)
 
-        return type.__new__(mcs, name, bases, dict)
+        # The node classes each attr may hold, directly or in lists, by module
+        # and name. An empty tuple means the attr holds no nodes. Attrs which
+        # are not listed may hold any node.
+        attr_types = {}
+
+        for base in reversed(bases):
+            attr_types.update(getattr(base, 'attr_types', ()))
+
+        for attr, names in dict.get('attr_types', {}).items():
+            attr_types[attr] = tuple(
+                name if '.' in name else '%s.%s' % (dict['__module__'], name)
+                for name in names)
+
+        dict['attr_types'] = attr_types
+
+        # The attrs which may hold nodes
+        dict['_node_attrs'] = tuple(attr for attr in dict['attrs']
+                                    if attr_types.get(attr) != ())
+
+        # Nodes keep their attributes in slots rather than a __dict__. Slots
+        # are made for the attrs which no base has a slot for yet, unless the
+        # class declares its own __slots__. Classes which serve as a second
+        # base declare empty ones, as only one base may add slots, and leave
+        # their attrs to the slots of their subclasses.
+        slots = list()
+        for base in bases:
+            slots.extend(slot for slot in getattr(base, '_slots', ())
+                         if slot not in slots)
+
+        if '__slots__' not in dict:
+            new_slots = list()
+            for attr in dict['attrs']:
+                if attr not in slots and attr not in new_slots:
+                    new_slots.append(attr)
+            dict['__slots__'] = tuple(new_slots)
+
+        # Every slot of the class, for reading all attributes which are set
+        dict['_slots'] = tuple(slots) + tuple(dict['__slots__'])
+
+        # Unless a class or its bases define their own __init__, it gets one
+        # which assigns its attrs directly
+        if '__init__' not in dict and all(
+                getattr(base.__init__, 'generated', False) or
+                base.__init__ == Node.__init__ for base in bases):
+            dict['__init__'] = _generate_init(name, dict['attrs'])
+
+        cls = type.__new__(mcs, name, bases, dict)
+        mcs.classes['%s.%s' % (cls.__module__, name)] = cls
+
+        _contained.clear()
+        _barren.clear()
+
+        return cls
+
+
+# Filled by the first positional argument, which the keyword only signature
+# of Node.__init__ rejects. Python 2 has no keyword only parameters.
+_NO_POSITIONAL = object()
+
+_INIT_TEMPLATE = """\
+def __init__(self, _positional=_NO_POSITIONAL, %(parameters)s**kwargs):
+    if _positional is not _NO_POSITIONAL:
+        raise TypeError('%(class_name)s() takes keyword arguments only')
+    if kwargs:
+        raise ValueError('Extraneous arguments')
+%(assignments)s
+    if %(deferred)s:
+        self._defer()
+"""
+
+def _generate_init(class_name, attrs):
+    """ Returns an __init__ taking each of attrs as a keyword argument, which
+    defaults to None, and assigning it to the node. Like Node.__init__, it
+    takes no positional arguments.
+
+    """
+
+    if not attrs:
+        def __init__(self, **kwargs):
+            if kwargs:
+                raise ValueError('Extraneous arguments')
+    else:
+        source = _INIT_TEMPLATE % {
+            'class_name': class_name,
+            'parameters': ''.join('%s=None, ' % (attr,) for attr in attrs),
+            'assignments': '\n'.join('    self.%s = %s' % (attr, attr)
+                                     for attr in attrs),
+            'deferred': ' or '.join('%s.__class__ is Deferred' % (attr,)
+                                    for attr in attrs),
+        }
+
+        namespace = {'Deferred': Deferred, '_NO_POSITIONAL': _NO_POSITIONAL}
+        code = compile(source, '<%s.__init__>' % (class_name,), 'exec')
+        six.exec_(code, namespace)
+        __init__ = namespace['__init__']
+
+    __init__.generated = True
+    return __init__
+
+
+class Deferred(object):
+    """ Placeholder for an attribute value which is computed by calling
+    function the first time the attribute is read.
+
+    """
+
+    def __init__(self, function):
+        self.function = function
 
 
 @six.add_metaclass(MetaNode)
 class Node(object):
     attrs = ()
+    __slots__ = ('_position', '_deferred')
 
     def __init__(self, **kwargs):
         values = kwargs.copy()
 
         for attr_name in self.attrs:
             value = values.pop(attr_name, None)
-            setattr(self, attr_name, value)
+
+            if isinstance(value, Deferred):
+                self._get_deferred(True)[attr_name] = value
+            else:
+                setattr(self, attr_name, value)
 
         if values:
             raise ValueError('Extraneous arguments')
 
+    def _defer(self):
+        # Moves Deferred values out of the slots they were assigned to
+        for attr_name in self.attrs:
+            value = _get_slot(self, attr_name)
+
+            if isinstance(value, Deferred):
+                delattr(self, attr_name)
+                self._get_deferred(True)[attr_name] = value
+
+    def _get_deferred(self, create=False):
+        # Read without going through __getattr__ when the slot is empty
+        try:
+            return _get_slot(self, '_deferred')
+        except AttributeError:
+            if not create:
+                return None
+
+        deferred = self._deferred = dict()
+        return deferred
+
+    def __getattr__(self, name):
+        # Only called for attributes which are not set, so deferred values
+        # are computed once and then found as ordinary attributes
+        deferred = self._get_deferred()
+
+        if deferred and name in deferred:
+            # Only dropped once computed, so a failure is raised again on the
+            # next read
+            value = deferred[name].function()
+            del deferred[name]
+            setattr(self, name, value)
+            return value
+
+        raise AttributeError(name)
+
+    def __getstate__(self):
+        # Deferred values refer to the parser, so compute them before pickling
+        for attr_name in list(self._get_deferred() or ()):
+            getattr(self, attr_name)
+
+        return dict(self.items())
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def items(self):
+        """ Yields the name and value of each attribute which is set, attrs
+        and others such as _position alike, without computing deferred ones
+        or including an index.
+
+        """
+
+        for slot in self._slots:
+            if slot not in _TRANSIENT_SLOTS:
+                try:
+                    yield slot, _get_slot(self, slot)
+                except AttributeError:
+                    pass
+
+    @property
+    def deferred(self):
+        """ Names of attributes which have not been computed yet """
+        return set(self._get_deferred() or ())
+
     def __equals__(self, other):
         if type(other) is not type(self):
             return False
@@ -51,10 +242,32 @@ class Node(object):
         return walk_tree(self)
 
     def filter(self, pattern):
-        for path, node in self:
-            if ((isinstance(pattern, type) and isinstance(node, pattern)) or
-                (node == pattern)):
+        # Only compilation units have a slot for an index
+        index = getattr(self, '_index', None)
+
+        if index is not None and isinstance(pattern, type):
+            for path, node in index.filter(pattern):
                 yield path, node
+            return
+
+        # Paths are only built for the nodes which match
+        walker = walk_tree(self, paths=False)
+
+        if not isinstance(pattern, type):
+            for node in walker:
+                if node == pattern:
+                    yield walker.path, node
+            return
+
+        # Leave out the nodes below which pattern can not occur
+        barren = barren_classes(pattern)
+
+        for node in walker:
+            if isinstance(node, pattern):
+                yield walker.path, node
+
+            if type(node) in barren:
+                walker.skip()
     
     def pprint(self, indent=0):
         indent_str = '| '*indent
@@ -85,22 +298,879 @@ class Node(object):
         if hasattr(self, "_position"):
             return self._position
 
-def walk_tree(root):
-    children = None
+# Reads a slot, raising AttributeError rather than calling __getattr__ when it
+# is empty
+_get_slot = object.__getattribute__
 
-    if isinstance(root, Node):
-        yield (), root
-        children = root.children
-    else:
-        children = root
+def contained_classes(node_class):
+    """ Returns the set of Node classes which may occur below a node of
+    node_class, going by the attr_types of the classes.
+
+    """
+
+    if not _contained:
+        classes = set(MetaNode.classes.values())
+        subclasses = dict()
+        contained = dict()
+
+        for name, cls in MetaNode.classes.items():
+            subclasses[name] = set(other for other in classes
+                                   if issubclass(other, cls))
+
+        # The classes of the nodes directly below
+        for cls in classes:
+            held = set()
+
+            for attr in cls.attrs:
+                names = cls.attr_types.get(attr)
+
+                if names is None:
+                    held = set(classes)
+                    break
+
+                for name in names:
+                    if name not in subclasses:
+                        raise ValueError('Unknown node class %s in attr_types '
+                                         'of %s' % (name, cls.__name__))
+
+                    held.update(subclasses[name])
+
+            contained[cls] = held
+
+        # Then those below them, until nothing changes
+        changed = True
+        while changed:
+            changed = False
+
+            for cls, held in contained.items():
+                size = len(held)
+
+                for other in list(held):
+                    held.update(contained[other])
+
+                changed = changed or len(held) != size
+
+        for cls, held in contained.items():
+            _contained[cls] = frozenset(held)
+
+    if node_class not in _contained:
+        # Shadowed by a later class of the same name
+        return frozenset(MetaNode.classes.values())
+
+    return _contained[node_class]
+
+def barren_classes(pattern):
+    """ Returns the set of Node classes below whose nodes no node of class
+    pattern can occur.
+
+    """
+
+    if pattern not in _barren:
+        _barren[pattern] = frozenset(
+            cls for cls in set(MetaNode.classes.values())
+            if not any(issubclass(other, pattern)
+                       for other in contained_classes(cls)))
+
+    return _barren[pattern]
+
+class TreePath(object):
+    """ The nodes and lists leading to a node, as yielded by walk_tree(). A
+    path holds its last item and the path leading to that, which it shares
+    with the paths below it, so each one takes constant time and memory to
+    make. It reads like the tuple of its items and compares equal to it.
+    Reading it from the start, such as iterating over it or making the tuple,
+    takes time in proportion to its length.
+
+    """
+
+    __slots__ = ('_parent', '_item', '_length')
+
+    def __init__(self, parent=None, item=None):
+        self._parent = parent
+        self._item = item
+        self._length = 0 if parent is None else parent._length + 1
+
+    def __len__(self):
+        return self._length
+
+    def __reversed__(self):
+        path = self
+
+        while path._length:
+            yield path._item
+            path = path._parent
+
+    def __iter__(self):
+        items = list(reversed(self))
+        items.reverse()
+        return iter(items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return tuple(self)[index]
+
+        if index < 0:
+            index += self._length
+
+        if not 0 <= index < self._length:
+            raise IndexError('path index out of range')
+
+        path = self
+        for _ in range(self._length - 1 - index):
+            path = path._parent
+
+        return path._item
+
+    def __eq__(self, other):
+        if isinstance(other, TreePath):
+            return self is other or (self._length == other._length and
+                                     tuple(self) == tuple(other))
+        elif isinstance(other, tuple):
+            return self._length == len(other) and tuple(self) == other
+
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __add__(self, other):
+        if isinstance(other, (TreePath, tuple)):
+            return tuple(self) + tuple(other)
+
+        return NotImplemented
+
+    def __radd__(self, other):
+        if isinstance(other, tuple):
+            return other + tuple(self)
+
+        return NotImplemented
+
+    def __repr__(self):
+        return repr(tuple(self))
+
+_EMPTY_PATH = TreePath()
+
+class TreeWalker(object):
+    """ Iterates over (path, node) for root and the nodes below it in
+    pre-order, where path is the TreePath of nodes and lists leading to node.
+    Calling skip() while at a node leaves out the nodes below it.
+
+    The paths share their common start, so the walk takes linear time. With
+    paths=False only the nodes are yielded, which saves making a path for
+    each node and list with children. The path of the node just yielded is
+    then built as a tuple on request by the path property.
+
+    """
+
+    def __init__(self, root, paths=True):
+        self.root = root
+        self._skipped = False
+
+        # The nodes and lists leading to the node just yielded, when walking
+        # without paths
+        self._containers = list()
+
+        if paths:
+            self._iterator = self._walk(root)
+        else:
+            self._iterator = self._walk_nodes(root)
+
+    def __iter__(self):
+        return self._iterator
+
+    def __next__(self):
+        return next(self._iterator)
+
+    next = __next__
+
+    def skip(self):
+        self._skipped = True
+
+    @property
+    def path(self):
+        return tuple(self._containers)
+
+    def _walk(self, root):
+        # Each entry holds the path to a node or list and an iterator over its
+        # children. Siblings share the path of their parent.
+        stack = list()
+
+        if isinstance(root, Node):
+            self._skipped = False
+            yield _EMPTY_PATH, root
+
+            if not self._skipped:
+                stack.append((TreePath(_EMPTY_PATH, root), iter(root.children)))
+        else:
+            stack.append((TreePath(_EMPTY_PATH, root), iter(root)))
+
+        while stack:
+            path, children = stack[-1]
+
+            for child in children:
+                if isinstance(child, Node):
+                    self._skipped = False
+                    yield path, child
+
+                    if not self._skipped:
+                        stack.append((TreePath(path, child),
+                                      iter(child.children)))
+                        break
+                elif isinstance(child, (list, tuple)) and child:
+                    stack.append((TreePath(path, child), iter(child)))
+                    break
+            else:
+                stack.pop()
+
+    def _walk_nodes(self, root):
+        # As _walk, with the nodes and lists on the way kept in one list
+        # alongside the stack of iterators instead of in a tuple per entry
+        containers = self._containers
+        stack = list()
+
+        if isinstance(root, Node):
+            self._skipped = False
+            yield root
+
+            if not self._skipped:
+                containers.append(root)
+                stack.append(iter(root.children))
+        else:
+            containers.append(root)
+            stack.append(iter(root))
+
+        while stack:
+            for child in stack[-1]:
+                if isinstance(child, Node):
+                    self._skipped = False
+                    yield child
+
+                    if not self._skipped:
+                        containers.append(child)
+                        stack.append(iter(child.children))
+                        break
+                elif isinstance(child, (list, tuple)) and child:
+                    containers.append(child)
+                    stack.append(iter(child))
+                    break
+            else:
+                stack.pop()
+                containers.pop()
+
+def walk_tree(root, paths=True):
+    return TreeWalker(root, paths)
+
+class TreeIndex(object):
+    """ The nodes below root by class, in pre-order, for answering filter()
+    with a node class without walking the tree, the parent of each node, and
+    which node is found at a position. The index reflects the tree as it was
+    when the index was built.
+
+    """
+
+    def __init__(self, root):
+        self.root = root
+
+        # Node class -> list of (pre-order number, node)
+        self._nodes = dict()
+
+        # id() of each node and non-empty list -> the node or list holding it
+        self._parents = dict()
+
+        # Start positions in increasing order and the innermost node from
+        # each one up to the next, made on the first call to node_at
+        self._starts = None
+        self._owners = None
+
+        nodes = self._nodes
+        parents = self._parents
+        stack = [(root, None)]
+        order = 0
+
+        # Attrs which hold no nodes according to attr_types are not read, so
+        # building the index takes less time than walking the tree
+        while stack:
+            value, parent = stack.pop()
+            parents[id(value)] = parent
+
+            if isinstance(value, Node):
+                cls = value.__class__
+                entry = (order, value)
+                order += 1
+
+                try:
+                    nodes[cls].append(entry)
+                except KeyError:
+                    nodes[cls] = [entry]
+
+                children = [getattr(value, attr) for attr in cls._node_attrs]
+            else:
+                children = value
+
+            for child in reversed(children):
+                if isinstance(child, Node) or (
+                        isinstance(child, (list, tuple)) and child):
+                    stack.append((child, value))
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._nodes.values())
+
+    def path(self, node):
+        """ Returns the path to node, as walk_tree() would yield it """
+
+        path = list()
+        parent = self._parents[id(node)]
+
+        while parent is not None:
+            path.append(parent)
+            parent = self._parents[id(parent)]
+
+        path.reverse()
+        return tuple(path)
+
+    def nodes(self, node_class):
+        """ Returns the list of the nodes of node_class or its subclasses, in
+        pre-order.
+
+        """
+
+        entries = [entries for cls, entries in self._nodes.items()
+                   if issubclass(cls, node_class)]
+
+        if len(entries) == 1:
+            return [node for _, node in entries[0]]
+
+        return [node for _, node in heapq.merge(*entries)]
+
+    def filter(self, node_class):
+        for node in self.nodes(node_class):
+            yield self.path(node), node
+
+    def parent(self, node):
+        """ Returns the node holding node, directly or in a list, or None for
+        the root.
+
+        """
+
+        parent = self._parents[id(node)]
+
+        while parent is not None and not isinstance(parent, Node):
+            parent = self._parents[id(parent)]
+
+        return parent
+
+    def ancestors(self, node):
+        """ Yields the nodes holding node, innermost first """
+
+        parent = self.parent(node)
+
+        while parent is not None:
+            yield parent
+            parent = self.parent(parent)
+
+    def enclosing(self, node, node_class):
+        """ Returns node or its innermost ancestor of node_class, or None """
+
+        if isinstance(node, node_class):
+            return node
+
+        for ancestor in self.ancestors(node):
+            if isinstance(ancestor, node_class):
+                return ancestor
+
+        return None
+
+    def node_at(self, position):
+        """ Returns the innermost node whose span holds position, a Position
+        or (line, column) tuple, or None. Spans end before the position after
+        their last token.
+
+        """
+
+        if self._starts is None:
+            self._index_spans()
+
+        i = bisect.bisect_right(self._starts, tuple(position)) - 1
+        return self._owners[i] if i >= 0 else None
+
+    def _index_spans(self):
+        nodes = self.nodes(Node)
+
+        # Each node's span grows to take in the spans of the nodes below it,
+        # as the parser leaves some out, such as the declarators of a
+        # variable declared in a for statement. The spans then nest.
+        spans = dict()
+
+        for node in reversed(nodes):
+            span = spans.get(id(node))
+            position = node.position
+
+            if position:
+                if span is not None:
+                    position = (min(position[0], span[0]),
+                                max(position[1], span[1]))
+                span = spans[id(node)] = position
+            elif span is None:
+                continue
+
+            parent = self.parent(node)
+
+            if parent is not None:
+                other = spans.get(id(parent))
+                if other is None:
+                    spans[id(parent)] = span
+                elif span[0] < other[0] or other[1] < span[1]:
+                    spans[id(parent)] = (min(span[0], other[0]),
+                                         max(span[1], other[1]))
+
+        # The spans in order of their starts, the outer ones first where they
+        # start together. The attrs of a node do not always follow the text,
+        # as the condition of a do statement comes before its body, so this
+        # differs from pre-order. Among equal spans, the node lowest in the
+        # tree comes last.
+        ordered = [(spans[id(node)], node) for node in nodes
+                   if id(node) in spans]
+        ordered.sort(key=lambda item: item[0][1], reverse=True)
+        ordered.sort(key=lambda item: item[0][0])
+
+        # Sweep through them, keeping the spans which hold the current start
+        # on a stack
+        starts = self._starts = list()
+        owners = self._owners = list()
+        stack = list()
+
+        def mark(start, owner):
+            if starts and start <= starts[-1]:
+                # Several spans start at once, the last one is innermost.
+                # A span closing inside one which overlaps it is not marked.
+                if start == starts[-1]:
+                    owners[-1] = owner
+                return
+
+            starts.append(start)
+            owners.append(owner)
+
+        def close():
+            _, end = stack.pop()
+
+            while stack and stack[-1][1] <= end:
+                stack.pop()
+
+            mark(end, stack[-1][0] if stack else None)
+
+        for span, node in ordered:
+            while stack and stack[-1][1] <= span[0]:
+                close()
+
+            mark(span[0], node)
+            stack.append((node, span[1]))
+
+        while stack:
+            close()
+
+def index_tree(compilation_unit):
+    """ Builds a TreeIndex for compilation_unit and keeps it there, so that
+    filter() with a node class uses it rather than walking the tree. Replaces
+    any index compilation_unit already has. Returns the index.
+
+    """
+
+    index = compilation_unit._index = TreeIndex(compilation_unit)
+    return index
+
+# ------------------------------------------------------------------------------
+# ---- Serialization ----
+#
+# A serialized tree is a header followed by its values in pre-order. Each value
+# is a one byte tag and its contents. Nodes are written as their shape, their
+# position if they have one, and the values of their attrs and of any other
+# attributes. A shape is a node class together with the names of the other
+# attributes, whether there is a position, and which values are None, an empty
+# list or a boolean. Those are part of the shape rather than written for each
+# node. Strings and shapes are written out once and referred to by index
+# afterwards. Lengths, indices and integers
+# are varints. Node positions are written as the difference to the start of the
+# previous node's position, and the end as the difference to the start, which
+# mostly fits a byte each.
+
+FORMAT_MAGIC = b'JAST'
+FORMAT_VERSION = 1
+
+(_NONE, _TRUE, _FALSE, _INT, _STRING, _STRING_REF, _LIST, _EMPTY_LIST, _TUPLE,
+ _SET, _NODE, _NODE_REF, _POSITION, _VALUE) = range(14)
+
+def _write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+def _write_signed(out, value):
+    # Zigzag encoded, so that small negative numbers stay short
+    _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+
+def _read_varint(data, i):
+    value = 0
+    shift = 0
+
+    while True:
+        byte = data[i]
+        i += 1
+        value |= (byte & 0x7f) << shift
+
+        if byte < 0x80:
+            return value, i
+
+        shift += 7
+
+def _write_text(out, text):
+    encoded = text.encode('utf-8')
+    _write_varint(out, len(encoded))
+    out.extend(encoded)
+
+def dumps(ast):
+    out = bytearray(FORMAT_MAGIC)
+    _write_varint(out, FORMAT_VERSION)
+
+    strings = dict()
+    shapes = dict()
+    attr_names = dict()
+    line, column = 0, 0
+
+    # Written iteratively, as expression trees may be deeper than the
+    # recursion limit
+    stack = [ast]
+
+    while stack:
+        value = stack.pop()
+        value_type = type(value)
+
+        if value is None:
+            out.append(_NONE)
+        elif value is True:
+            out.append(_TRUE)
+        elif value is False:
+            out.append(_FALSE)
+        elif isinstance(value, six.string_types):
+            index = strings.get(value)
+
+            if index is None:
+                strings[value] = len(strings)
+                out.append(_STRING)
+                _write_text(out, value)
+            else:
+                out.append(_STRING_REF)
+                _write_varint(out, index)
+        elif value_type is Position:
+            out.append(_POSITION)
+            _write_varint(out, value.line)
+            _write_varint(out, value.column)
+        elif isinstance(value, Node):
+            names = attr_names.get(value_type)
+            if names is None:
+                names = attr_names[value_type] = frozenset(value.attrs)
+
+            # Read first, as that computes deferred attributes
+            values = [getattr(value, attr) for attr in value.attrs]
+
+            attributes = dict(value.items())
+            extra_names = tuple(sorted(
+                name for name in attributes if name not in names))
+
+            # Positions are common enough to be written in the node header
+            position = attributes.get('_position')
+            if (type(position) is tuple and len(position) == 2 and
+                    type(position[0]) is Position and
+                    type(position[1]) is Position):
+                extra_names = tuple(name for name in extra_names
+                                    if name != '_position')
+            else:
+                position = None
+
+            values.extend(attributes[name] for name in extra_names)
+            kinds = tuple(_NONE if item is None else
+                          _TRUE if item is True else
+                          _FALSE if item is False else
+                          _EMPTY_LIST if type(item) is list and not item else
+                          _VALUE for item in values)
+
+            shape = (value_type, extra_names, position is not None, kinds)
+            index = shapes.get(shape)
+
+            if index is None:
+                shapes[shape] = len(shapes)
+                out.append(_NODE)
+                _write_text(out, '%s.%s' % (value_type.__module__,
+                                            value_type.__name__))
+                _write_varint(out, len(extra_names) * 2 + (position is not None))
+                for name in extra_names:
+                    _write_text(out, name)
+                out.extend(kinds)
+            else:
+                out.append(_NODE_REF)
+                _write_varint(out, index)
+
+            if position is not None:
+                start, end = position
+                _write_signed(out, start.line - line)
+                _write_signed(out, start.column - column)
+                line, column = start
+                _write_signed(out, end.line - line)
+                _write_signed(out, end.column - column)
+
+            stack.extend(reversed([item for item, kind in zip(values, kinds)
+                                   if kind == _VALUE]))
+        elif isinstance(value, six.integer_types):
+            out.append(_INT)
+            _write_signed(out, value)
+        elif value_type is list and not value:
+            out.append(_EMPTY_LIST)
+        elif value_type in (list, tuple, set):
+            out.append(_LIST if value_type is list else
+                       _TUPLE if value_type is tuple else _SET)
+            _write_varint(out, len(value))
+            stack.extend(reversed(list(value)))
+        else:
+            raise ValueError('Can not serialize %s' % (value_type.__name__,))
+
+    return bytes(out)
+
+_BUILD_TEMPLATE = """\
+def build(values, position):
+    node = new(node_class)
+%(assignments)s
+    return node
+"""
+
+# Node builders of loads() by shape, which recur across trees
+_builders = dict()
+
+def _generate_build(node_class, names, has_position, kinds):
+    """ Returns a function which makes a node of a shape from the values read
+    for it and its position. The names have been checked to be slots of
+    node_class.
+
+    """
+
+    key = (node_class, tuple(names), has_position, tuple(kinds))
+
+    if key not in _builders:
+        _builders[key] = _compile_build(node_class, names, has_position, kinds)
+
+    return _builders[key]
+
+def _compile_build(node_class, names, has_position, kinds):
+    assignments = list()
+    values = 0
+
+    for name, kind in zip(names, kinds):
+        if kind == _VALUE:
+            value = 'values[%d]' % (values,)
+            values += 1
+        else:
+            value = {_NONE: 'None', _EMPTY_LIST: '[]', _TRUE: 'True',
+                     _FALSE: 'False'}[kind]
+
+        assignments.append('    node.%s = %s' % (name, value))
+
+    if has_position:
+        assignments.append('    node._position = position')
+
+    namespace = {'new': object.__new__, 'node_class': node_class}
+    code = compile(_BUILD_TEMPLATE % {'assignments': '\n'.join(assignments)},
+                   '<build %s>' % (node_class.__name__,), 'exec')
+    six.exec_(code, namespace)
+    return namespace['build']
+
+def loads(data):
+    """ Reads a tree written by dumps(). Only Node classes, strings, numbers,
+    positions and containers are created, so untrusted data can not run code.
+
+    """
+
+    data = bytearray(data)
+
+    if data[:len(FORMAT_MAGIC)] != FORMAT_MAGIC:
+        raise ValueError('Not a serialized syntax tree')
+
+    try:
+        return _read_tree(data)
+    except (IndexError, TypeError, UnicodeDecodeError):
+        # Reading past the end, or values that do not fit where they are,
+        # such as lists in a set
+        raise ValueError('Truncated or corrupt syntax tree')
+
+def _read_tree(data):
+    version, i = _read_varint(data, len(FORMAT_MAGIC))
+
+    if version != FORMAT_VERSION:
+        raise ValueError('Unsupported syntax tree format version %d' % (version,))
+
+    strings = list()
+    shapes = list()
+    line, column = 0, 0
+
+    # Makes Positions without the Python level __new__ of namedtuples
+    new_tuple = tuple.__new__
+
+    # The container being read: how many values it still needs, those read
+    # so far, and its kind, node shape and position. Enclosing containers are
+    # saved on the stack.
+    left, values, kind, shape, position = 1, list(), None, None, None
+    stack = list()
+
+    while True:
+        tag = data[i]
+        i += 1
+
+        # Most frequent first. None, empty lists and booleans mostly come from
+        # the shapes rather than tags.
+        if tag == _NODE_REF or tag == _NODE:
+            if tag == _NODE_REF:
+                index = data[i]
+                if index < 0x80:
+                    i += 1
+                else:
+                    index, i = _read_varint(data, i)
+                new_shape = shapes[index]
+            else:
+                length, i = _read_varint(data, i)
+                name = data[i:i + length].decode('utf-8')
+                i += length
+
+                try:
+                    node_class = MetaNode.classes[name]
+                except KeyError:
+                    raise ValueError('Unknown node class %s' % (name,))
+
+                header, i = _read_varint(data, i)
+                names = list(node_class.attrs)
+
+                for _ in range(header >> 1):
+                    length, i = _read_varint(data, i)
+                    name = str(data[i:i + length].decode('utf-8'))
+                    i += length
+
+                    if name not in node_class._slots or name in _TRANSIENT_SLOTS:
+                        raise ValueError('Unknown attribute %s of %s' % (
+                            name, node_class.__name__))
+
+                    names.append(name)
+
+                kinds = list(data[i:i + len(names)])
+                i += len(names)
+
+                if (len(kinds) != len(names) or
+                        not set(kinds) <= set((_NONE, _TRUE, _FALSE,
+                                               _EMPTY_LIST, _VALUE))):
+                    raise ValueError('Invalid node shape')
+
+                # Only the values not given by the shape are read
+                new_shape = (_generate_build(node_class, names, header & 1,
+                                             kinds),
+                             header & 1, kinds.count(_VALUE))
+                shapes.append(new_shape)
+
+            new_position = None
+
+            if new_shape[1]:
+                a, b, c, d = data[i], data[i + 1], data[i + 2], data[i + 3]
+
+                if a | b | c | d < 0x80:
+                    i += 4
+                else:
+                    a, i = _read_varint(data, i)
+                    b, i = _read_varint(data, i)
+                    c, i = _read_varint(data, i)
+                    d, i = _read_varint(data, i)
+
+                line += (a >> 1) ^ -(a & 1)
+                column += (b >> 1) ^ -(b & 1)
+                new_position = (
+                    new_tuple(Position, (line, column)),
+                    new_tuple(Position, (line + ((c >> 1) ^ -(c & 1)),
+                                         column + ((d >> 1) ^ -(d & 1)))))
+
+            length = new_shape[2]
+
+            if length:
+                stack.append((left, values, kind, shape, position))
+                left, values = length, list()
+                kind, shape, position = _NODE, new_shape, new_position
+                continue
+
+            value = new_shape[0]((), new_position)
+        elif tag == _STRING_REF:
+            index = data[i]
+            if index < 0x80:
+                i += 1
+            else:
+                index, i = _read_varint(data, i)
+            value = strings[index]
+        elif tag == _LIST or tag == _TUPLE or tag == _SET:
+            length = data[i]
+            if length < 0x80:
+                i += 1
+            else:
+                length, i = _read_varint(data, i)
+
+            if length:
+                stack.append((left, values, kind, shape, position))
+                left, values, kind, shape = length, list(), tag, None
+                continue
+
+            value = [] if tag == _LIST else () if tag == _TUPLE else set()
+        elif tag == _EMPTY_LIST:
+            value = []
+        elif tag == _NONE:
+            value = None
+        elif tag == _STRING:
+            length, i = _read_varint(data, i)
+            value = data[i:i + length].decode('utf-8')
+            i += length
+            strings.append(value)
+        elif tag == _POSITION:
+            # Not a node position, so not part of their differences
+            position_line, i = _read_varint(data, i)
+            position_column, i = _read_varint(data, i)
+            value = Position(position_line, position_column)
+        elif tag == _TRUE:
+            value = True
+        elif tag == _FALSE:
+            value = False
+        elif tag == _INT:
+            value, i = _read_varint(data, i)
+            value = (value >> 1) ^ -(value & 1)
+        else:
+            raise ValueError('Invalid tag %d' % (tag,))
+
+        values.append(value)
+        left -= 1
+
+        # Complete the containers which now have all of their values
+        while not left:
+            if not stack:
+                return values[0]
+
+            if shape is not None:
+                value = shape[0](values, position)
+            elif kind == _LIST:
+                value = values
+            elif kind == _TUPLE:
+                value = tuple(values)
+            else:
+                value = set(values)
 
-    for child in children:
-        if isinstance(child, (Node, list, tuple)):
-            for path, node in walk_tree(child):
-                yield (root,) + path, node
+            left, values, kind, shape, position = stack.pop()
+            values.append(value)
+            left -= 1
 
 def dump(ast, file):
-    pickle.dump(ast, file)
+    file.write(dumps(ast))
 
 def load(file):
-    return pickle.load(file)
+    return loads(file.read())
@@ -0,0 +1,132 @@
+import io
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from .parser import JavaSyntaxError, Parser
+from .tokenizer import tokenize
+
+FileResult = namedtuple('FileResult', ['path', 'tree', 'error'])
+
+MapResult = namedtuple('MapResult', ['path', 'value', 'error'])
+
+def find_java_files(paths):
+    """ Yields the given files and the .java files below the given
+    directories.
+
+    """
+
+    for path in paths:
+        if not os.path.isdir(path):
+            yield path
+            continue
+
+        for directory, directory_names, file_names in os.walk(path):
+            directory_names.sort()
+
+            for file_name in sorted(file_names):
+                if file_name.endswith('.java'):
+                    yield os.path.join(directory, file_name)
+
+def schedule(paths):
+    """ Orders paths largest file first. The workers then finish on the small
+    files instead of waiting on a big one that was started last.
+
+    """
+
+    def size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    return sorted(paths, key=size, reverse=True)
+
+def parse_file(path, outline=False):
+    with io.open(path, 'rb') as source_file:
+        data = source_file.read()
+
+    parser = Parser(tokenize(data), outline=outline)
+    return parser.parse_compilation_unit()
+
+def describe_error(error):
+    if isinstance(error, JavaSyntaxError):
+        if error.at is not None and error.at.position is not None:
+            return 'JavaSyntaxError at line %d, column %d: %s' % (
+                error.at.position[0], error.at.position[1], error.description)
+
+        return 'JavaSyntaxError: %s' % (error.description,)
+
+    return '%s: %s' % (type(error).__name__, error)
+
+def type_names(compilation_unit):
+    return [declaration.name for declaration in compilation_unit.types]
+
+def _parse_file(path, outline):
+    # Exceptions are described here, as they do not all survive pickling
+    try:
+        return FileResult(path, parse_file(path, outline), None)
+    except Exception as e:
+        return FileResult(path, None, describe_error(e))
+
+def _map_file(path, function, outline):
+    try:
+        return MapResult(path, function(parse_file(path, outline)), None)
+    except Exception as e:
+        return MapResult(path, None, describe_error(e))
+
+def parse_files(paths, workers=None, outline=False):
+    """ Parses the Java files at or below paths in a pool of worker processes
+    and yields a FileResult for each one as it finishes. Files which fail to
+    parse have a tree of None and a description of the error.
+
+    """
+
+    return _run_files(paths, workers, _parse_file, outline)
+
+def map_files(paths, function, workers=None, outline=False):
+    """ Parses the Java files at or below paths in a pool of worker processes
+    and calls function with each CompilationUnit there. Yields a MapResult
+    holding what function returned for each file as it finishes, so only
+    those values are pickled back rather than the trees. function has to be
+    picklable, such as a function defined at the top level of a module.
+
+    """
+
+    return _run_files(paths, workers, _map_file, function, outline)
+
+def reduce_files(paths, function, reducer, initial=None, workers=None,
+                 outline=False):
+    """ Combines the values of map_files with reducer as they arrive, starting
+    from initial if given. Returns the combined value and the list of
+    MapResults of the files which failed.
+
+    """
+
+    value = initial
+    first = initial is None
+    errors = list()
+
+    for result in map_files(paths, function, workers, outline):
+        if result.error is not None:
+            errors.append(result)
+        elif first:
+            value = result.value
+            first = False
+        else:
+            value = reducer(value, result.value)
+
+    return value, errors
+
+def _run_files(paths, workers, task, *args):
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(task, path, *args)
+                   for path in schedule(find_java_files(paths))]
+
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            # Stop early when the caller does not read every result
+            for future in futures:
+                future.cancel()
@@ -0,0 +1,198 @@
+import hashlib
+import os
+import tempfile
+
+import six
+
+from . import __version__
+from . import ast
+from .parse import parse
+from .parser import parse_str
+
+# Atomic on Python 2 as well, except on Windows where the target must not
+# exist yet
+_replace = getattr(os, 'replace', os.rename)
+
+class ParseCache(object):
+    """ Caches parse results in a directory, one file per distinct source text
+    and library version. Files are written atomically, so several processes
+    may share a directory. Once the files take up more than max_size bytes,
+    the least recently used ones are removed.
+
+    """
+
+    def __init__(self, directory, max_size=256 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Created by another process in the meantime
+                if not os.path.isdir(directory):
+                    raise
+
+        self.size = self.disk_usage()
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
+
+    def key(self, code, outline=False, guess_level=True):
+        if isinstance(code, six.text_type):
+            code = code.encode('utf-8')
+
+        digest = hashlib.sha256()
+        digest.update(('%s\0%d\0%d\0' % (__version__, outline, guess_level)
+                       ).encode('ascii'))
+        digest.update(code)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:])
+
+    def parse(self, code, outline=False):
+        """ Returns parse.parse(code, outline), from the cache if possible """
+
+        key = self.key(code, outline)
+        tree = self.get(key)
+
+        if tree is None:
+            tree = parse(code, outline=outline)
+            self.put(key, tree)
+
+        return tree
+
+    def parse_str(self, source, guess_level=True):
+        """ Returns parser.parse_str(source, guess_level=guess_level), from
+        the cache if possible. With guess_level, that is the same as parse().
+
+        """
+
+        key = self.key(source, guess_level=guess_level)
+        tree = self.get(key)
+
+        if tree is None:
+            tree = parse_str(source, guess_level=guess_level)
+            self.put(key, tree)
+
+        return tree
+
+    def get(self, key):
+        path = self.path(key)
+
+        try:
+            with open(path, 'rb') as cache_file:
+                tree = ast.load(cache_file)
+        except Exception:
+            # Missing, evicted meanwhile, or written by an incompatible version
+            self.misses += 1
+            return None
+
+        # The modification time orders files for eviction
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return tree
+
+    def put(self, key, tree):
+        path = self.path(key)
+        directory = os.path.dirname(path)
+
+        if not os.path.isdir(directory):
+            try:
+                os.mkdir(directory)
+            except OSError:
+                pass
+
+        handle, temporary_path = tempfile.mkstemp(dir=directory, prefix='.')
+
+        try:
+            with os.fdopen(handle, 'wb') as cache_file:
+                ast.dump(tree, cache_file)
+
+            # The file may be there already, written by another process
+            try:
+                self.size -= os.path.getsize(path)
+            except OSError:
+                pass
+
+            self.size += os.path.getsize(temporary_path)
+            _replace(temporary_path, path)
+        except Exception:
+            try:
+                os.remove(temporary_path)
+            except OSError:
+                pass
+            raise
+
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        """ Yields (modification time, size, path) for each cached file """
+
+        for shard in os.listdir(self.directory):
+            shard_path = os.path.join(self.directory, shard)
+
+            if not os.path.isdir(shard_path):
+                continue
+
+            for name in os.listdir(shard_path):
+                # Files still being written
+                if name.startswith('.'):
+                    continue
+
+                path = os.path.join(shard_path, name)
+
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+
+                yield stat.st_mtime, stat.st_size, path
+
+    def disk_usage(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """ Removes the least recently used files until the cache is down to
+        three quarters of max_size, so that evicting is not needed again on the
+        next put.
+
+        """
+
+        entries = sorted(self.entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        target = self.max_size * 3 // 4
+
+        for _, entry_size, path in entries:
+            if size <= target:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                # Removed by another process
+                pass
+
+            size -= entry_size
+
+        self.size = size
+
+    def clear(self):
+        for _, _, path in list(self.entries()):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        self.size = 0
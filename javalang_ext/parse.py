@@ -1,6 +1,9 @@
 
-from .parser import Parser
-from .tokenizer import tokenize
+from . import tree
+from .ast import Node, index_tree
+from .parser import JavaSyntaxError, Parser
+from .tokenizer import EndOfInput, Position, retokenize, tokenize
+from .util import LazyList
 
 def parse_expression(exp):
     if not exp.endswith(';'):
@@ -47,7 +50,205 @@ def parse_type_signature(sig):
 
     return parser.parse_class_or_interface_declaration()
 
-def parse(s):
+def parse(s, outline=False, index=False):
     tokens = tokenize(s)
-    parser = Parser(tokens)
+    parser = Parser(tokens, outline=outline, index=index)
     return parser.parse()
+
+def parse_header(s):
+    # Tokens are read on demand, so the text after the first type name is
+    # never tokenized
+    tokens = LazyList(tokenize(s))
+    parser = Parser(tokens)
+    return parser.parse_header()
+
+def reparse(compilation_unit, tokens, edit, code):
+    """ Return the CompilationUnit and tokens of code, the text produced by
+    applying edit to the text that tokens and compilation_unit were read from.
+
+    When the edit lies within a single member of a type (a method, field,
+    initializer or nested type), only that member is parsed again and
+    compilation_unit itself is returned, changed in place: the member is
+    replaced in the list holding it and the positions of the nodes after the
+    edit are moved, while the other nodes are kept. Otherwise the whole text
+    is parsed into a new CompilationUnit and compilation_unit is left as it
+    was. Either way tokens is left unchanged. A compilation_unit with an
+    index from index_tree() gets a new one.
+
+    """
+
+    indexed = getattr(compilation_unit, '_index', None) is not None
+    member = None
+    edit_end = edit.offset + edit.deleted
+
+    if tokens:
+        member = _find_member(compilation_unit, tokens, edit.offset, edit_end)
+
+    if member is not None:
+        declarations, index, first, last, rule = member
+
+        # Read before retokenize shifts the tokens after the edit
+        first_offset = tokens[first].offset
+        last_end = tokens[last].end
+        old_edit_end = tokens[first].source.position(edit_end)
+
+    new_tokens = retokenize(tokens, edit, code)
+
+    if member is not None:
+        delta = len(edit.inserted) - edit.deleted
+        node = _parse_member(new_tokens, first, first_offset, last_end + delta,
+                             rule)
+
+        if node is not None:
+            new_edit_end = new_tokens[first].source.position(
+                edit.offset + len(edit.inserted))
+            _shift_positions(compilation_unit, old_edit_end, new_edit_end)
+            declarations[index] = node
+
+            if indexed:
+                index_tree(compilation_unit)
+
+            return compilation_unit, new_tokens
+
+    parser = Parser(new_tokens, index=indexed)
+    return parser.parse_compilation_unit(), new_tokens
+
+def _members(declaration):
+    """ Returns the list of body declarations of a type along with the parser
+    rule which reads one of them, or None if they can not be reparsed on
+    their own.
+
+    """
+
+    if isinstance(declaration, tree.ClassDeclaration):
+        return declaration.body, 'parse_class_body_declaration'
+    elif isinstance(declaration, tree.EnumDeclaration):
+        return declaration.body.declarations, 'parse_class_body_declaration'
+    elif isinstance(declaration, tree.InterfaceDeclaration):
+        return declaration.body, 'parse_interface_body_declaration'
+
+    return None, None
+
+def _token_span(node, tokens):
+    """ Returns the indices of the first and last tokens of node """
+
+    start, end = node._position
+
+    # Index of the first token at or after each end of the node
+    indices = list()
+    for position in (start, end):
+        low, high = 0, len(tokens)
+        while low < high:
+            mid = (low + high) // 2
+            if tokens[mid].position < position:
+                low = mid + 1
+            else:
+                high = mid
+        indices.append(low)
+
+    first, last = indices[0], indices[1] - 1
+
+    if first <= last < len(tokens) and tokens[first].position == start:
+        return first, last
+
+    return None
+
+def _find_member(compilation_unit, tokens, start, end):
+    """ Finds the innermost body declaration whose tokens contain the text
+    from offset start to end, not including its last character. Returns the
+    list holding it, its index there, its first and last token indices and the
+    rule to parse it with.
+
+    """
+
+    found = None
+    declarations = compilation_unit.types
+    rule = None
+
+    while declarations:
+        for index, declaration in enumerate(declarations):
+            if getattr(declaration, '_position', None) is None:
+                continue
+
+            span = _token_span(declaration, tokens)
+
+            if (span and tokens[span[0]].offset <= start and
+                    end < tokens[span[1]].end):
+                break
+        else:
+            break
+
+        if rule is not None:
+            found = (declarations, index, span[0], span[1], rule)
+
+        declarations, rule = _members(declaration)
+
+    return found
+
+def _parse_member(tokens, first, first_offset, last_end, rule):
+    """ Parses the tokens of an edited member, which has to start and end at
+    the same tokens as before. Returns None if they do not form exactly one
+    declaration.
+
+    """
+
+    if first >= len(tokens) or tokens[first].offset != first_offset:
+        return None
+
+    low, high = first, len(tokens)
+    while low < high:
+        mid = (low + high) // 2
+        if tokens[mid].end < last_end:
+            low = mid + 1
+        else:
+            high = mid
+
+    if low == len(tokens) or tokens[low].end != last_end:
+        return None
+
+    parser = Parser(tokens[first:low + 1])
+
+    try:
+        node = getattr(parser, rule)()
+    except (JavaSyntaxError, StopIteration):
+        return None
+
+    if node is None or not isinstance(parser.tokens.look(), EndOfInput):
+        return None
+
+    return node
+
+def _shift_positions(root, old_end, new_end):
+    """ Moves the positions of nodes after an edit, which ended at old_end
+    before and ends at new_end now. Nodes ending before the edit are
+    skipped along with their children.
+
+    """
+
+    def shift(position):
+        if position is None or position < old_end:
+            return position
+        elif position.line == old_end.line:
+            return Position(new_end.line,
+                            new_end.column + position.column - old_end.column)
+        else:
+            return Position(position.line + new_end.line - old_end.line,
+                            position.column)
+
+    stack = [root]
+
+    while stack:
+        node = stack.pop()
+
+        if isinstance(node, Node):
+            position = getattr(node, '_position', None)
+            if position is not None:
+                # Nodes lie within the span of their parent
+                if position[1] is not None and position[1] < old_end:
+                    continue
+
+                node._position = (shift(position[0]), shift(position[1]))
+
+            stack.extend(node.children)
+        elif isinstance(node, (list, tuple)):
+            stack.extend(node)
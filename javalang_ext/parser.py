@@ -2,10 +2,10 @@ import six
 
 from . import tree
 from . import util
-from .ast import Node
+from .ast import Deferred, Node, index_tree
 from .tokenizer import (
     EndOfInput, Modifier, BasicType, Identifier,
-    Annotation, Literal, Operator, Position, tokenize
+    Annotation, Literal, Operator, Position, tokenize, tokenize_span
 )
 
 ENABLE_DEBUG_SUPPORT = False
@@ -61,18 +61,54 @@ def parse_debug(method):
         def _method(self):
             start_pos = self.tokens.look().position
             ret_obj = method(self)
-            end_pos = Position(
-                line = self.tokens.look(-1).position.line,
-                column = self.tokens.look(-1).position.column + len(self.tokens.look(-1).value)
-            )
-            if end_pos is None:
-                end_pos = self.tokens.list[-1].position
             if isinstance(ret_obj, Node):
+                end_pos = Position(
+                    line = self.tokens.look(-1).position.line,
+                    column = self.tokens.look(-1).position.column + len(self.tokens.look(-1).value)
+                )
+                if end_pos is None:
+                    end_pos = self.tokens.list[-1].position
                 ret_obj._position = (start_pos, end_pos)
             return ret_obj
         
         return _method
 
+def parse_memo(method):
+    """ Cache the outcome of a rule by token index when the parser was created
+    with memoize=True, so speculative parses that are abandoned and retried do
+    not redo work. Both results and syntax errors are cached. Results are
+    shared between the attempts, so this is only used for rules whose callers
+    wrap the result rather than modify it.
+
+    """
+
+    def _method(self):
+        if self.memo is None:
+            return method(self)
+
+        key = (method, self.tokens.marker)
+        entry = self.memo.get(key)
+
+        if entry is not None:
+            result, marker = entry
+
+            if marker is None:
+                raise JavaSyntaxError(result.description, result.at)
+
+            self.tokens.marker = marker
+            return result
+
+        try:
+            result = method(self)
+        except JavaSyntaxError as e:
+            self.memo[key] = (e, None)
+            raise
+
+        self.memo[key] = (result, self.tokens.marker)
+        return result
+
+    return _method
+
 # ------------------------------------------------------------------------------
 # ---- Parsing exception ----
 
@@ -105,11 +141,53 @@ class Parser(object):
                             set(('+', '-')),
                             set(('*', '/', '%')) ]
 
-    def __init__(self, tokens):
-        self._token_store = list(tokens)
+    operator_levels = dict((operator, level)
+                           for level, operators in enumerate(operator_precedence)
+                           for operator in operators)
+
+    # Bound on the number of tokens predict_parenthesis looks at
+    PREDICTION_LIMIT = 64
+
+    # Non-identifier tokens which may appear in a type
+    TYPE_VALUES = set(('<', '>', '?', ',', '.', '[', ']', 'extends', 'super'))
+
+    # Tokens other than literals and identifiers which may start the operand
+    # of a cast
+    UNARY_START_VALUES = Operator.PREFIX | set(('(', '<', 'this', 'super', 'new',
+                                                'void'))
+
+    def __init__(self, tokens, memoize=False, lazy_bodies=False, outline=False,
+                 index=False):
+        # Sequences such as a CompactTokenStream are consumed directly
+        if hasattr(tokens, '__getitem__'):
+            self._token_store = tokens
+        else:
+            self._token_store = list(tokens)
         self.tokens = util.LookAheadListIterator(self._token_store)
         self.tokens.set_default(EndOfInput(None))
 
+        # Packrat table of (rule, token index) -> (result, end index), see
+        # parse_memo
+        self.memo = dict() if memoize else None
+
+        # Method and constructor bodies are skipped and only parsed when the
+        # body attribute is first read, see parse_method_body
+        self.lazy_bodies = lazy_bodies
+
+        # Only declarations are parsed. Bodies, initializer blocks and enum
+        # constant arguments are skipped and left empty, and variable
+        # initializers are skipped and left as None
+        self.outline = outline
+
+        # Compilation units get a TreeIndex for filter(), see index_tree.
+        # Building it reads every body, so lazy bodies are parsed right away.
+        self.index = index
+
+        # Entry rule chosen by parse(guess_level=True), and whether a rule
+        # other than that one produced the result
+        self.guessed_level = None
+        self.guess_fell_back = False
+
         self.debug = False
 
 # ------------------------------------------------------------------------------
@@ -125,6 +203,9 @@ class Parser(object):
         self.tokens = util.LookAheadListIterator(self._token_store)
         self.tokens.set_default(EndOfInput(None))
 
+        if self.memo is not None:
+            self.memo.clear()
+
 
 # ------------------------------------------------------------------------------
 # ---- Parsing entry point ----
@@ -150,16 +231,98 @@ class Parser(object):
                 (self.parse_statement, 'Statement'),
                 (self.parse_local_variable_declaration_statement, 'LocalVariableDeclarationStatement'),
             ]
+
+            # Start at the first level that can succeed, and only go back to
+            # the levels before it if none of the later ones do
+            level = self.guess_entry_level()
+            tried_functions = tried_functions[level:] + tried_functions[:level]
+            self.guessed_level = tried_functions[0][1]
+
             for func, parse_msg in tried_functions:
                 node, msg = _trycatch_parse_attempts(node, msg, func, parse_msg)
                 if node is not None:
                     break
+
+            self.guess_fell_back = msg != self.guessed_level
+
             if node is None:
                 raise JavaSyntaxError('Guessing statement type failed.')
+            elif show_level and self.guess_fell_back:
+                print('Guessing that the expression is:', msg,
+                      '(fell back from %s)' % (self.guessed_level,))
             elif show_level:
                 print('Guessing that the expression is:', msg)
             return node
 
+    def guess_entry_level(self):
+        """ Returns the index in the parse() cascade of the first entry rule
+        which may succeed, judging by the leading tokens. The rules before it
+        are certain to fail.
+
+        """
+
+        token = self.tokens.look()
+
+        if isinstance(token, EndOfInput) or token.value in ('package', 'import', ';'):
+            return 0
+
+        self.tokens.push_marker()
+
+        try:
+            try:
+                self.parse_modifiers()
+            except (JavaSyntaxError, StopIteration):
+                return 0
+
+            token = self.tokens.look()
+
+            if (token.value in ('class', 'enum', 'interface', 'package') or
+                self.is_annotation_declaration()):
+                return 0
+
+            if token.value in ('void', '<'):
+                return 2
+
+            if not isinstance(token, (Identifier, BasicType)):
+                return 3
+
+            if self.would_accept(Identifier, '('):
+                # A constructor declaration needs a body after its parameters
+                depth = 0
+                i = 1
+
+                while True:
+                    value = self.tokens.look(i).value
+                    i += 1
+
+                    if value is None:
+                        return 3
+                    elif value == '(':
+                        depth += 1
+                    elif value == ')':
+                        depth -= 1
+                        if depth == 0:
+                            break
+
+                if self.tokens.look(i).value in ('{', 'throws'):
+                    return 2
+
+                return 3
+
+            # Fields and methods are a type followed by their name
+            try:
+                self.parse_type()
+            except (JavaSyntaxError, StopIteration):
+                return 3
+
+            if isinstance(self.tokens.look(), Identifier):
+                return 2
+
+            return 3
+
+        finally:
+            self.tokens.pop_marker(True)
+
 # ------------------------------------------------------------------------------
 # ---- Helper methods ----
 
@@ -220,42 +383,42 @@ class Parser(object):
 
         return True
 
-    def build_binary_operation(self, parts, start_level=0):
-        if len(parts) == 1:
-            return parts[0]
+    def build_binary_operation(self, parts):
+        """ Combines alternating operands and operators into left associative
+        BinaryOperations by precedence climbing. Operands and operators wait
+        on explicit stacks until an operator of lower or equal precedence
+        arrives, so long chains need neither recursion nor rescans.
+
+        """
 
-        operands = list()
+        operator_levels = self.operator_levels
+        operands = [parts[0]]
         operators = list()
 
-        i = 0
+        for j in range(1, len(parts), 2):
+            level = operator_levels[parts[j]]
 
-        for level in range(start_level, len(self.operator_precedence)):
-            for j in range(1, len(parts) - 1, 2):
-                if parts[j] in self.operator_precedence[level]:
-                    operand = self.build_binary_operation(parts[i:j], level + 1)
-                    operator = parts[j]
-                    i = j + 1
+            while operators and operator_levels[operators[-1]] >= level:
+                self.reduce_binary_operation(operands, operators)
 
-                    operands.append(operand)
-                    operators.append(operator)
+            operators.append(parts[j])
+            operands.append(parts[j + 1])
 
-            if operands:
-                break
+        while operators:
+            self.reduce_binary_operation(operands, operators)
 
-        operand = self.build_binary_operation(parts[i:], level + 1)
-        operands.append(operand)
+        return operands[0]
 
-        operation = operands[0]
+    def reduce_binary_operation(self, operands, operators):
+        operandr = operands.pop()
+        operandl = operands.pop()
 
-        for operator, operandr in zip(operators, operands[1:]):
-            start_pos = operation._position[0]
-            operation = tree.BinaryOperation(operandl=operation)
-            operation.operator = operator
-            operation.operandr = operandr
-            end_pos = operandr._position[1]
-            operation._position = (start_pos, end_pos)
+        operation = tree.BinaryOperation(operandl=operandl,
+                                         operator=operators.pop(),
+                                         operandr=operandr)
+        operation._position = (operandl._position[0], operandr._position[1])
 
-        return operation
+        operands.append(operation)
 
     def is_annotation(self, i=0):
         """ Returns true if the position is the start of an annotation application
@@ -275,6 +438,70 @@ class Parser(object):
         return (isinstance(self.tokens.look(i), Annotation)
                 and self.tokens.look(i + 1).value == 'interface')
 
+    def predict_parenthesis(self):
+        """ Predicts which reading of the '(' at the current position can
+        succeed, by scanning ahead to the matching ')'. Returns 'lambda' or
+        'cast' if only that attempt (followed by a parenthesized expression)
+        needs to be tried, 'primary' if neither can succeed, or None if the
+        prescan can not tell.
+
+        """
+
+        token = self.tokens.look(1)
+
+        # Lambda parameters and cast types start with one of these
+        if not (isinstance(token, (Identifier, BasicType, Modifier, Annotation))
+                or token.value == ')'):
+            return 'primary'
+
+        depth = 1
+        angle_depth = 0
+        type_like = True
+        i = 1
+
+        while depth:
+            if i > self.PREDICTION_LIMIT:
+                return None
+
+            token = self.tokens.look(i)
+            value = token.value
+
+            if value is None or isinstance(token, Annotation):
+                return None
+            elif value == '(':
+                depth += 1
+                type_like = False
+            elif value == ')':
+                depth -= 1
+            elif isinstance(token, (Identifier, BasicType)):
+                pass
+            elif value == '<':
+                angle_depth += 1
+            elif value == '>':
+                angle_depth -= 1
+            elif value == ',':
+                type_like = type_like and angle_depth > 0
+            elif value not in self.TYPE_VALUES:
+                type_like = False
+
+            i += 1
+
+        following = self.tokens.look(i).value
+
+        if following == '->':
+            # '(a) -> ...' is parsed as an expression followed by '->'
+            if i == 3 and isinstance(self.tokens.look(1), Identifier):
+                return 'primary'
+
+            return 'lambda'
+
+        elif type_like and i > 2 and (following in self.UNARY_START_VALUES or
+                                      isinstance(self.tokens.look(i),
+                                                 (Literal, Identifier, BasicType))):
+            return 'cast'
+
+        return 'primary'
+
 # ------------------------------------------------------------------------------
 # ---- Parsing methods ----
 
@@ -316,11 +543,33 @@ class Parser(object):
 
     @parse_debug
     def parse_compilation_unit(self):
+        type_declarations = list()
+
+        package, import_declarations = self.parse_compilation_unit_header()
+
+        while not isinstance(self.tokens.look(), EndOfInput):
+            try:
+                type_declaration = self.parse_type_declaration()
+            except StopIteration:
+                self.illegal("Unexpected end of input")
+
+            if type_declaration:
+                type_declarations.append(type_declaration)
+
+        compilation_unit = tree.CompilationUnit(package=package,
+                                                imports=import_declarations,
+                                                types=type_declarations)
+
+        if self.index:
+            index_tree(compilation_unit)
+
+        return compilation_unit
+
+    def parse_compilation_unit_header(self):
         package = None
         package_annotations = None
         javadoc = None
         import_declarations = list()
-        type_declarations = list()
 
         self.tokens.push_marker()
         next_token = self.tokens.look()
@@ -354,19 +603,54 @@ class Parser(object):
             import_declaration = self.parse_import_declaration()
             import_declarations.append(import_declaration)
 
-        while not isinstance(self.tokens.look(), EndOfInput):
-            try:
-                type_declaration = self.parse_type_declaration()
-            except StopIteration:
-                self.illegal("Unexpected end of input")
+        return package, import_declarations
 
-            if type_declaration:
-                type_declarations.append(type_declaration)
+    @parse_debug
+    def parse_header(self):
+        """ Parses the package and import declarations and the header of the
+        first type declaration, stopping after that type's name. The returned
+        CompilationUnit holds at most one type, without its body.
+
+        """
+
+        type_declarations = list()
+
+        package, import_declarations = self.parse_compilation_unit_header()
+
+        while self.try_accept(';'):
+            pass
+
+        if not isinstance(self.tokens.look(), EndOfInput):
+            type_declaration = self.parse_type_declaration_header()
+            type_declarations.append(type_declaration)
 
         return tree.CompilationUnit(package=package,
                                     imports=import_declarations,
                                     types=type_declarations)
 
+    @parse_debug
+    def parse_type_declaration_header(self):
+        modifiers, annotations, javadoc = self.parse_modifiers()
+
+        if self.try_accept('class'):
+            declaration_type = tree.ClassDeclaration
+        elif self.try_accept('enum'):
+            declaration_type = tree.EnumDeclaration
+        elif self.try_accept('interface'):
+            declaration_type = tree.InterfaceDeclaration
+        elif self.is_annotation_declaration():
+            self.accept('@', 'interface')
+            declaration_type = tree.AnnotationDeclaration
+        else:
+            self.illegal("Expected type declaration")
+
+        name = self.parse_identifier()
+
+        return declaration_type(name=name,
+                                modifiers=modifiers,
+                                annotations=annotations,
+                                documentation=javadoc)
+
     @parse_debug
     def parse_import_declaration(self):
         qualified_identifier = list()
@@ -834,13 +1118,13 @@ class Parser(object):
 
         elif self.would_accept('static', '{'):
             self.accept('static')
-            block = self.parse_block()
+            block = self.parse_initializer_block()
             parse_block = tree.BlockStatement(statements=block)
             parse_block.static = True
             return parse_block
 
         elif self.would_accept('{'):
-            block = self.parse_block()
+            block = self.parse_initializer_block()
             parse_block = tree.BlockStatement(statements=block)
             parse_block.static = False
             return parse_block
@@ -848,6 +1132,13 @@ class Parser(object):
         else:
             return self.parse_member_declaration()
 
+    def parse_initializer_block(self):
+        if self.outline:
+            self.skip_balanced()
+            return list()
+
+        return self.parse_block()
+
     @parse_debug
     def parse_member_declaration(self):
         modifiers, annotations, javadoc = self.parse_modifiers()
@@ -946,7 +1237,7 @@ class Parser(object):
             throws = self.parse_qualified_identifier_list()
 
         if self.would_accept('{'):
-            body = self.parse_block()
+            body = self.parse_method_body()
         else:
             self.accept(';')
 
@@ -965,7 +1256,7 @@ class Parser(object):
             throws = self.parse_qualified_identifier_list()
 
         if self.would_accept('{'):
-            body = self.parse_block()
+            body = self.parse_method_body()
         else:
             self.accept(';')
 
@@ -982,12 +1273,128 @@ class Parser(object):
         if self.try_accept('throws'):
             throws = self.parse_qualified_identifier_list()
 
-        body = self.parse_block()
+        body = self.parse_method_body()
 
         return tree.ConstructorDeclaration(parameters=formal_parameters,
                                            throws=throws,
                                            body=body)
 
+    def parse_method_body(self):
+        if self.outline:
+            self.skip_balanced()
+            return list()
+
+        if not self.lazy_bodies:
+            return self.parse_block()
+
+        start = self.tokens.marker
+        self.skip_balanced()
+        end = self.tokens.marker
+
+        # The body keeps hold of as little as possible until it is parsed:
+        # where the tokens came from text, only its span of that text, which
+        # is tokenized again, and otherwise only its own tokens
+        first = self._token_store[start]
+        source = first.source
+        memoize = self.memo is not None
+
+        if source is not None and first.offset is not None:
+            body_start = first.offset
+            body_end = self._token_store[end - 1].end
+
+            def body_tokens():
+                return list(tokenize_span(source, body_start, body_end))
+        else:
+            tokens = list(self._token_store[start:end])
+
+            def body_tokens():
+                return tokens
+
+        def parse_body():
+            parser = Parser(body_tokens(), memoize=memoize, lazy_bodies=True)
+            return parser.parse_block()
+
+        return Deferred(parse_body)
+
+    def skip_balanced(self, opening='{', closing='}'):
+        """ Moves past a balanced block or list without parsing its contents """
+
+        self.accept(opening)
+        depth = 1
+
+        while depth:
+            token = self.tokens.look()
+
+            if isinstance(token, EndOfInput):
+                self.illegal("Expected '%s'" % (closing,))
+
+            next(self.tokens)
+
+            if token.value == opening:
+                depth += 1
+            elif token.value == closing:
+                depth -= 1
+
+    def skip_variable_initializer(self):
+        """ Moves past a variable initializer without parsing it, up to the ';'
+        or the ',' before the next declarator. Returns False and leaves the
+        position unchanged if the initializer ends otherwise.
+
+        """
+
+        start = self.tokens.marker
+        depth = 0
+
+        while True:
+            token = self.tokens.look()
+            value = token.value
+
+            if value in ('(', '[', '{'):
+                depth += 1
+            elif value in (')', ']', '}'):
+                if depth == 0:
+                    break
+                depth -= 1
+            elif depth == 0 and value == ';':
+                break
+            elif (depth == 0 and value == ',' and
+                  self.would_accept_declarators()):
+                break
+            elif isinstance(token, EndOfInput):
+                break
+
+            next(self.tokens)
+
+        if value in (';', ','):
+            return True
+
+        self.tokens.marker = start
+        return False
+
+    def would_accept_declarators(self):
+        """ Whether the ',' at the current position separates variable
+        declarators rather than type arguments. Declarators without an
+        initializer, as in "a = 1, b, c;", are followed up to the '=' or ';'
+        which sets them apart from type arguments such as "<K, V, W>".
+
+        """
+
+        i = 0
+
+        while self.tokens.look(i).value == ',':
+            if not isinstance(self.tokens.look(i + 1), Identifier):
+                return False
+
+            i += 2
+            while (self.tokens.look(i).value == '[' and
+                   self.tokens.look(i + 1).value == ']'):
+                i += 2
+
+            if self.tokens.look(i).value in ('=', ';'):
+                return True
+
+        return False
+
     @parse_debug
     def parse_generic_method_or_constructor_declaration(self):
         type_parameters = self.parse_type_parameters()
@@ -1149,7 +1556,7 @@ class Parser(object):
             throws = self.parse_qualified_identifier_list()
 
         if self.would_accept('{'):
-            body = self.parse_block()
+            body = self.parse_method_body()
         else:
             self.accept(';')
 
@@ -1168,7 +1575,7 @@ class Parser(object):
             throws = self.parse_qualified_identifier_list()
 
         if self.would_accept('{'):
-            body = self.parse_block()
+            body = self.parse_method_body()
         else:
             self.accept(';')
 
@@ -1309,6 +1716,14 @@ class Parser(object):
 
     @parse_debug
     def parse_variable_initializer(self):
+        if self.outline:
+            if not self.skip_variable_initializer():
+                self.parse_variable_initializer_contents()
+            return None
+
+        return self.parse_variable_initializer_contents()
+
+    def parse_variable_initializer_contents(self):
         if self.would_accept('{'):
             return self.parse_array_initializer()
         else:
@@ -1923,6 +2338,12 @@ class Parser(object):
 # ------------------------------------------------------------------------------
 # -- Expression operators --
 
+    # The only memoized rule. A statement such as a<b> c = ... which fails as
+    # a declaration after its initializer is read again as an assignment,
+    # which reads the initializer again from here. With syntax errors nested
+    # in such initializers that takes exponential time without the memo.
+    # Other rules are only read again through this one.
+    @parse_memo
     @parse_debug
     def parse_expression_3(self):
         prefix_operators = list()
@@ -1930,26 +2351,31 @@ class Parser(object):
             prefix_operators.append(self.tokens.next().value)
 
         if self.would_accept('('):
-            try:
-                with self.tokens:
+            prediction = self.predict_parenthesis()
+
+            if prediction in (None, 'lambda'):
+                try:
+                    with self.tokens:
                         lambda_exp = self.parse_lambda_expression()
                         if lambda_exp:
                             return lambda_exp
-            except JavaSyntaxError:
-                pass
-            try:
-                with self.tokens:
-                    self.accept('(')
-                    cast_target = self.parse_type()
-                    self.accept(')')
-                    expression = self.parse_expression_3()
-
-                    cast = tree.Cast(type=cast_target,
-                                     expression=expression)
-                    cast.prefix_operators = prefix_operators
-                    return cast
-            except JavaSyntaxError:
-                pass
+                except JavaSyntaxError:
+                    pass
+
+            if prediction in (None, 'cast'):
+                try:
+                    with self.tokens:
+                        self.accept('(')
+                        cast_target = self.parse_type()
+                        self.accept(')')
+                        expression = self.parse_expression_3()
+
+                        cast = tree.Cast(type=cast_target,
+                                         expression=expression)
+                        cast.prefix_operators = prefix_operators
+                        return cast
+                except JavaSyntaxError:
+                    pass
 
         primary = self.parse_primary()
         if hasattr(primary, 'prefix_operators') and type(primary.prefix_operators) is list:
@@ -2422,7 +2848,11 @@ class Parser(object):
         constant_name = self.parse_identifier()
 
         if self.would_accept('('):
-            arguments = self.parse_arguments()
+            if self.outline:
+                self.skip_balanced('(', ')')
+                arguments = list()
+            else:
+                arguments = self.parse_arguments()
 
         if self.would_accept('{'):
             body = self.parse_class_body()
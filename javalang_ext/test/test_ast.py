@@ -0,0 +1,811 @@
+import io
+import pickle
+import unittest
+
+from .. import ast, parse, parser, tokenizer, tree
+
+
+def normalize(value):
+    # Sets may repr in a different order once rebuilt
+    if isinstance(value, ast.Node):
+        return (type(value).__name__, value.position,
+                [normalize(getattr(value, attr)) for attr in value.attrs])
+    elif isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    elif isinstance(value, set):
+        return sorted(value)
+
+    return value
+
+
+class TestSerialization(unittest.TestCase):
+
+    CODE = """
+package a.b;
+
+import java.util.List;
+
+public class A<T extends Comparable<T>> extends B implements C {
+    private static final int[] VALUES = {1, -2, 3};
+
+    @Override
+    public final <U> List<U> f(final int x, String... rest) throws E {
+        if (x > 0 && !done) {
+            return g(x - 1, "a\\u00e9", 'c')[0].h();
+        }
+        for (int i = 0; i < x; i++) { synchronized (this) { ++count; } }
+        Runnable r = () -> { super.run(); };
+        return null;
+    }
+
+    enum Color { RED, GREEN(1) { void f() {} } }
+}
+"""
+
+    def parse(self, code, lazy_bodies=False):
+        tokens = list(tokenizer.tokenize(code))
+        return parser.Parser(tokens, lazy_bodies=lazy_bodies).parse_compilation_unit()
+
+    def test_round_trip(self):
+        # Given
+        unit = self.parse(self.CODE)
+
+        # When
+        loaded = ast.loads(ast.dumps(unit))
+
+        # Then
+        self.assertEqual(normalize(loaded), normalize(unit))
+
+    def test_values(self):
+        # Given
+        node = tree.Literal(value=u'\xe9', prefix_operators=[-1, 300],
+                            postfix_operators=(True, False), selectors=set(['a']),
+                            qualifier=2 ** 70)
+
+        # When
+        loaded = ast.loads(ast.dumps(node))
+
+        # Then
+        self.assertEqual(loaded.value, u'\xe9')
+        self.assertEqual(loaded.prefix_operators, [-1, 300])
+        self.assertEqual(loaded.postfix_operators, (True, False))
+        self.assertEqual(loaded.selectors, set(['a']))
+        self.assertEqual(loaded.qualifier, 2 ** 70)
+        self.assertIsNone(loaded.position)
+
+    def test_other_attributes(self):
+        # Given
+        node = tree.Cast(type=None, expression=tree.Literal(value='1'))
+        node.prefix_operators = ['-']
+
+        # When
+        loaded = ast.loads(ast.dumps(node))
+
+        # Then
+        self.assertEqual(loaded.prefix_operators, ['-'])
+        self.assertFalse(hasattr(loaded, 'selectors'))
+
+    def test_other_positions(self):
+        # Given a position without an end and one held by an attribute,
+        # neither of which is written in a node header
+        unit = self.parse(self.CODE)
+        nodes = [node for _, node in unit]
+        nodes[3]._position = (tokenizer.Position(40, 7), None)
+        unit.types[0].documentation = tokenizer.Position(50, 2)
+        expected = [node.position for _, node in unit]
+
+        # When
+        loaded = ast.loads(ast.dumps(unit))
+
+        # Then
+        self.assertEqual([node.position for _, node in loaded], expected)
+        self.assertEqual([node for _, node in loaded][3]._position,
+                         (tokenizer.Position(40, 7), None))
+        self.assertEqual(loaded.types[0].documentation,
+                         tokenizer.Position(50, 2))
+
+    def test_empty_lists_not_shared(self):
+        # Given
+        data = ast.dumps([tree.Literal(selectors=[]), tree.Literal(selectors=[])])
+
+        # When
+        first, second = ast.loads(data)
+
+        # Then
+        first.selectors.append(1)
+        self.assertEqual(second.selectors, [])
+
+    def test_smaller_than_repr(self):
+        # Given
+        unit = self.parse(self.CODE)
+
+        # When
+        data = ast.dumps(unit)
+
+        # Then
+        self.assertLess(len(data), len(repr(unit)) // 2)
+
+    def test_deep_tree(self):
+        # Given
+        unit = parse.parse("class A { int x = " + " + ".join(["a"] * 5000) + "; }")
+
+        # When
+        loaded = ast.loads(ast.dumps(unit))
+
+        # Then
+        expression = loaded.types[0].fields[0].declarators[0].initializer
+        depth = 0
+        while isinstance(expression, tree.BinaryOperation):
+            expression = expression.operandl
+            depth += 1
+        self.assertEqual(depth, 4999)
+
+    def test_lazy_bodies(self):
+        # Given
+        unit = self.parse(self.CODE, lazy_bodies=True)
+
+        # When
+        loaded = ast.loads(ast.dumps(unit))
+
+        # Then
+        self.assertEqual(normalize(loaded), normalize(self.parse(self.CODE)))
+        self.assertEqual(loaded.types[0].methods[0].deferred, set())
+
+    def test_file(self):
+        # Given
+        unit = self.parse(self.CODE)
+        stream = io.BytesIO()
+
+        # When
+        ast.dump(unit, stream)
+        stream.seek(0)
+        loaded = ast.load(stream)
+
+        # Then
+        self.assertEqual(normalize(loaded), normalize(unit))
+
+    def test_invalid(self):
+        # Given
+        data = ast.dumps(self.parse(self.CODE))
+
+        # Then
+        for invalid in (b'', b'\x80\x03]q\x00.', b'JAST\x02' + data[5:],
+                        data[:len(data) // 2],
+                        data.replace(b'javalang_ext.tree.CompilationUnit',
+                                     b'javalang_ext.tree.CompilationUnitX')):
+            with self.assertRaises(ValueError):
+                ast.loads(invalid)
+
+    def test_invalid_values(self):
+        # Given a set of lists
+        data = ast.dumps(tree.Literal(value=[[1]]))
+        data = data.replace(bytearray([ast._LIST, 1, ast._LIST]),
+                            bytearray([ast._SET, 1, ast._LIST]))
+
+        # Then
+        with self.assertRaises(ValueError):
+            ast.loads(data)
+
+    def test_not_serializable(self):
+        with self.assertRaises(ValueError):
+            ast.dumps(tree.Literal(value=object()))
+
+
+class TestSlots(unittest.TestCase):
+
+    def test_no_dict(self):
+        # Given
+        node = tree.MethodDeclaration(name='f', documentation='/** f */')
+
+        # Then
+        self.assertFalse(hasattr(node, '__dict__'))
+        self.assertEqual(node.documentation, '/** f */')
+        with self.assertRaises(AttributeError):
+            node.other = 1
+
+    def test_parser_attributes(self):
+        # Given
+        unit = parse.parse("class A { int x = (a + b).c; }")
+
+        # When
+        initializer = unit.types[0].fields[0].declarators[0].initializer
+
+        # Then
+        self.assertIsInstance(initializer, tree.BinaryOperation)
+        self.assertEqual(len(initializer.selectors), 1)
+        self.assertIsNotNone(initializer.position)
+
+    def test_annotation_method(self):
+        # Given
+        unit = parse.parse("@interface A { /** Doc */ int value() default 1; }")
+
+        # When
+        method = unit.types[0].body[0]
+
+        # Then
+        self.assertIsInstance(method, tree.AnnotationMethod)
+        self.assertEqual(method.documentation, '/** Doc */')
+
+    def test_items(self):
+        # Given
+        node = tree.Cast(type=None, expression=None)
+        node.prefix_operators = ['-']
+
+        # Then
+        self.assertEqual(sorted(node.items()), [('expression', None),
+                                                ('prefix_operators', ['-']),
+                                                ('type', None)])
+
+    def test_pickle(self):
+        # Given
+        unit = parse.parse("class A { int x = (a + b).c; }")
+
+        # When
+        loaded = pickle.loads(pickle.dumps(unit))
+
+        # Then
+        self.assertEqual(normalize(loaded), normalize(unit))
+        self.assertEqual(
+            loaded.types[0].fields[0].declarators[0].initializer.selectors[0].member,
+            'c')
+
+    def test_own_slots(self):
+        # Given
+        class Annotated(tree.Literal):
+            attrs = ()
+            __slots__ = ('note',)
+
+        # When
+        node = Annotated(value='1')
+        node.note = 'one'
+
+        # Then
+        self.assertEqual((node.value, node.note), ('1', 'one'))
+
+
+class TestInit(unittest.TestCase):
+
+    def test_defaults(self):
+        # When
+        node = tree.MethodInvocation(member='f')
+
+        # Then
+        self.assertEqual(node.member, 'f')
+        self.assertIsNone(node.qualifier)
+        self.assertIsNone(node.position)
+
+    def test_extraneous_arguments(self):
+        with self.assertRaises(ValueError):
+            tree.MethodInvocation(member='f', other=1)
+
+        with self.assertRaises(ValueError):
+            tree.This(other=1)
+
+    def test_positional_arguments(self):
+        with self.assertRaises(TypeError):
+            tree.MethodInvocation('f')
+
+        with self.assertRaises(TypeError):
+            tree.MethodInvocation(None, 'f')
+
+        with self.assertRaises(TypeError):
+            tree.This('x')
+
+    def test_deferred(self):
+        # Given
+        calls = []
+        body = ast.Deferred(lambda: calls.append(1) or [])
+
+        # When
+        node = tree.MethodDeclaration(name='f', body=body)
+
+        # Then
+        self.assertEqual(node.deferred, set(['body']))
+        self.assertEqual(calls, [])
+        self.assertEqual(node.body, [])
+        self.assertEqual(node.deferred, set())
+
+    def test_own_init(self):
+        # Given
+        class Named(tree.Literal):
+            attrs = ()
+
+            def __init__(self, name, **kwargs):
+                super(Named, self).__init__(value=name, **kwargs)
+
+        class Renamed(Named):
+            attrs = ()
+
+        # When
+        node = Renamed('x', qualifier='q')
+
+        # Then
+        self.assertEqual((node.value, node.qualifier), ('x', 'q'))
+
+
+class TestWalkTree(unittest.TestCase):
+
+    CODE = "class A { int x = 1; void f() { g(); } }"
+
+    def test_paths(self):
+        # Given
+        unit = parse.parse(self.CODE)
+        declaration = unit.types[0]
+        method = declaration.methods[0]
+
+        # When
+        walked = dict((id(node), path) for path, node in ast.walk_tree(unit))
+
+        # Then
+        self.assertEqual(walked[id(unit)], ())
+        self.assertEqual(walked[id(method)],
+                         (unit, unit.types, declaration, declaration.body))
+        self.assertEqual(walked[id(method.body[0])],
+                         (unit, unit.types, declaration, declaration.body,
+                          method, method.body))
+
+    def test_order(self):
+        # Given
+        unit = parse.parse(self.CODE)
+
+        # When
+        names = [type(node).__name__ for _, node in unit]
+
+        # Then
+        self.assertEqual(names, ['CompilationUnit', 'ClassDeclaration',
+                                 'FieldDeclaration', 'BasicType',
+                                 'VariableDeclarator', 'Literal',
+                                 'MethodDeclaration', 'StatementExpression',
+                                 'MethodInvocation'])
+
+    def test_list_root(self):
+        # Given
+        body = parse.parse(self.CODE).types[0].body
+
+        # When
+        walked = list(ast.walk_tree(body))
+
+        # Then
+        self.assertIs(walked[0][1], body[0])
+        self.assertEqual(walked[0][0], (body,))
+
+    def test_skip(self):
+        # Given
+        walker = ast.walk_tree(parse.parse(self.CODE))
+        names = []
+
+        # When
+        for _, node in walker:
+            names.append(type(node).__name__)
+            if isinstance(node, (tree.FieldDeclaration, tree.MethodDeclaration)):
+                walker.skip()
+
+        # Then
+        self.assertEqual(names, ['CompilationUnit', 'ClassDeclaration',
+                                 'FieldDeclaration', 'MethodDeclaration'])
+
+    def test_next(self):
+        # Given
+        unit = parse.parse(self.CODE)
+        walker = ast.walk_tree(unit)
+
+        # Then
+        self.assertEqual(next(walker), ((), unit))
+        walker.skip()
+        self.assertEqual(list(walker), [])
+
+    def test_without_paths(self):
+        # Given
+        unit = parse.parse(self.CODE)
+        expected = list(ast.walk_tree(unit))
+        walker = ast.walk_tree(unit, paths=False)
+
+        # When
+        walked = [(walker.path, node) for node in walker]
+
+        # Then
+        self.assertEqual(len(walked), len(expected))
+        for (path, node), (expected_path, expected_node) in zip(walked,
+                                                                expected):
+            self.assertIs(node, expected_node)
+            self.assertEqual([id(item) for item in path],
+                             [id(item) for item in expected_path])
+
+    def test_skip_without_paths(self):
+        # Given
+        walker = ast.walk_tree(parse.parse(self.CODE), paths=False)
+        names = []
+
+        # When
+        for node in walker:
+            names.append(type(node).__name__)
+            if isinstance(node, (tree.FieldDeclaration, tree.MethodDeclaration)):
+                walker.skip()
+
+        # Then
+        self.assertEqual(names, ['CompilationUnit', 'ClassDeclaration',
+                                 'FieldDeclaration', 'MethodDeclaration'])
+
+    def test_deep_expression(self):
+        # Given
+        expression = parse.parse_expression(" + ".join(["a"] * 20000))
+
+        # When
+        walker = ast.walk_tree(expression, paths=False)
+        count = sum(1 for _ in walker)
+
+        # Then
+        self.assertEqual(count, 39999)
+        self.assertEqual(walker.path, ())
+
+    def test_deep_iteration(self):
+        # Given a chain too deep for a tuple per path
+        expression = tree.MemberReference(member='a')
+        for _ in range(100000):
+            expression = tree.BinaryOperation(
+                operator='+', operandl=expression,
+                operandr=tree.MemberReference(member='a'))
+
+        # When
+        count = 0
+        deepest = ()
+        for path, node in expression:
+            count += 1
+            if len(path) > len(deepest):
+                deepest, deepest_node = path, node
+
+        # Then
+        self.assertEqual(count, 200001)
+        self.assertEqual(len(deepest), 100000)
+        self.assertIs(deepest[0], expression)
+        self.assertIs(deepest[-1].operandl, deepest_node)
+
+    def test_path(self):
+        # Given
+        unit = parse.parse(self.CODE)
+        declaration = unit.types[0]
+
+        # When
+        path = dict((id(node), path) for path, node in unit)[id(declaration.fields[0])]
+
+        # Then
+        self.assertIsInstance(path, ast.TreePath)
+        self.assertEqual(len(path), 4)
+        self.assertEqual(list(path), [unit, unit.types, declaration,
+                                      declaration.body])
+        self.assertEqual(list(reversed(path)), [declaration.body, declaration,
+                                                unit.types, unit])
+        self.assertIs(path[-2], declaration)
+        self.assertEqual(path[1:3], (unit.types, declaration))
+        self.assertEqual(path + (1,), tuple(path) + (1,))
+        self.assertEqual((1,) + path, (1,) + tuple(path))
+        self.assertIn(declaration, path)
+        self.assertNotEqual(path, tuple(path)[:-1])
+        with self.assertRaises(IndexError):
+            path[4]
+
+    def test_deep_tree(self):
+        # Given
+        unit = parse.parse("class A { int x = " + " + ".join(["a"] * 5000) + "; }")
+
+        # When
+        references = list(unit.filter(tree.MemberReference))
+
+        # Then
+        self.assertEqual(len(references), 5000)
+        self.assertEqual(len(references[0][0]), 5006)
+
+
+class TestFilter(unittest.TestCase):
+
+    CODE = """
+package a;
+
+import java.util.List;
+
+@Deprecated
+class A<T extends Comparable<T>> extends B<T> implements C<? super T> {
+    private static final int[] VALUES = {1, -2, 3};
+    static { init(); }
+
+    @SuppressWarnings(value = {"a"}, other = @Other(f()))
+    public <U> List<U> f(final int x, String... rest) throws E {
+        for (final String s : rest) continue;
+        Runnable r = () -> { super.run(); };
+        Function<String, Integer> p = String::length;
+        int[][] grid = new int[3][];
+        Object o = new Object() { int hidden = g(); };
+        Class<?> c = int[].class;
+        try (InputStream in = open()) { read(in); }
+        catch (IOException | RuntimeException ex) { log(ex); }
+        switch (x) { case 1: y = x > 1 ? (int) z : -(a.b.c); break; }
+        return this.<String>gen(A.this.f, super.g());
+    }
+
+    enum Color { RED, GREEN(1) { void f() { h(); } } }
+
+    @interface Ann { int value() default 1; }
+}
+"""
+
+    def test_contained_classes(self):
+        self.assertEqual(ast.contained_classes(tree.Import), frozenset())
+        self.assertEqual(ast.contained_classes(tree.ReferenceType),
+                         frozenset([tree.Type, tree.BasicType,
+                                    tree.ReferenceType, tree.TypeArgument]))
+        self.assertIn(tree.MethodInvocation,
+                      ast.contained_classes(tree.ClassDeclaration))
+
+    def test_barren_classes(self):
+        # When
+        barren = ast.barren_classes(tree.MethodInvocation)
+
+        # Then
+        self.assertIn(tree.ReferenceType, barren)
+        self.assertIn(tree.Import, barren)
+        self.assertNotIn(tree.FormalParameter, barren)
+
+    def test_same_as_walk(self):
+        # Given
+        unit = parse.parse(self.CODE)
+
+        for node_class in (tree.MethodInvocation, tree.ReferenceType,
+                           tree.TypeArgument, tree.Import, tree.Literal,
+                           tree.Declaration, ast.Node):
+            # When
+            filtered = [node for _, node in unit.filter(node_class)]
+
+            # Then
+            self.assertEqual(filtered, [node for _, node in unit
+                                        if isinstance(node, node_class)])
+
+    def test_attr_types(self):
+        # Given
+        unit = parse.parse(self.CODE)
+
+        # Then
+        for _, node in unit:
+            for attr in node.attrs:
+                names = node.attr_types.get(attr)
+                if names is None:
+                    continue
+
+                node_classes = tuple(ast.MetaNode.classes[name] for name in names)
+                walker = ast.walk_tree([getattr(node, attr)])
+                for _, child in walker:
+                    self.assertIsInstance(child, node_classes)
+                    walker.skip()
+
+    def test_skips_barren_nodes(self):
+        # Given a tree which does not follow the attr_types
+        invocation = tree.MethodInvocation(member='f')
+        reference_type = tree.ReferenceType(name='A',
+                                            arguments=[invocation])
+
+        # Then
+        self.assertEqual(list(reference_type.filter(tree.MethodInvocation)), [])
+        self.assertEqual(len(list(ast.walk_tree(reference_type))), 2)
+
+    def test_pattern_node(self):
+        # Given
+        unit = parse.parse(self.CODE)
+        method = unit.types[0].methods[0]
+
+        # When
+        found = list(unit.filter(method))
+
+        # Then
+        self.assertEqual(len(found), 1)
+        self.assertIs(found[0][1], method)
+
+
+
+class TestIndex(unittest.TestCase):
+
+    CODE = TestFilter.CODE
+
+    def test_same_as_walk(self):
+        # Given
+        unit = parse.parse(self.CODE, index=True)
+
+        for node_class in (tree.MethodInvocation, tree.ReferenceType,
+                           tree.Literal, tree.Declaration, tree.Expression,
+                           tree.CompilationUnit, ast.Node):
+            # When
+            filtered = list(unit.filter(node_class))
+
+            # Then
+            expected = [(path, node) for path, node in ast.walk_tree(unit)
+                        if isinstance(node, node_class)]
+            self.assertEqual(len(filtered), len(expected))
+            for (path, node), (expected_path, expected_node) in zip(filtered,
+                                                                    expected):
+                self.assertIs(node, expected_node)
+                self.assertEqual([id(item) for item in path],
+                                 [id(item) for item in expected_path])
+
+    def test_parser_option(self):
+        # When
+        indexed = parse.parse(self.CODE, index=True)
+        plain = parse.parse(self.CODE)
+
+        # Then
+        self.assertIsInstance(indexed._index, ast.TreeIndex)
+        self.assertIs(indexed._index.root, indexed)
+        self.assertIsNone(getattr(plain, '_index', None))
+        self.assertEqual(len(indexed._index), len(list(ast.walk_tree(indexed))))
+
+    def test_nodes(self):
+        # Given
+        unit = parse.parse(self.CODE)
+        index = ast.TreeIndex(unit)
+
+        # Then
+        self.assertEqual(index.nodes(tree.MethodDeclaration),
+                         [node for _, node in unit.filter(tree.MethodDeclaration)])
+        self.assertEqual(index.nodes(tree.PackageDeclaration), [unit.package])
+        self.assertEqual(index.nodes(tree.Import), unit.imports)
+        self.assertEqual(index.nodes(tree.WhileStatement), [])
+
+    def test_index_tree(self):
+        # Given
+        unit = parse.parse(self.CODE)
+        index = ast.index_tree(unit)
+
+        # When the tree is changed, the index is not
+        unit.types[0].body = []
+
+        # Then
+        self.assertIs(unit._index, index)
+        self.assertEqual(len(list(unit.filter(tree.MethodDeclaration))), 2)
+        self.assertEqual(len(list(ast.index_tree(unit).filter(
+            tree.MethodDeclaration))), 0)
+
+    def test_pattern_node(self):
+        # Given
+        unit = parse.parse(self.CODE, index=True)
+        method = unit.types[0].methods[0]
+
+        # When
+        found = list(unit.filter(method))
+
+        # Then
+        self.assertEqual(len(found), 1)
+        self.assertIs(found[0][1], method)
+
+    def test_not_saved(self):
+        # Given
+        unit = parse.parse(self.CODE, index=True)
+
+        # Then
+        self.assertEqual(ast.dumps(unit), ast.dumps(parse.parse(self.CODE)))
+        self.assertIsNone(getattr(pickle.loads(pickle.dumps(unit)), '_index',
+                                  None))
+        self.assertNotIn('_index', dict(unit.items()))
+
+
+    def test_parent(self):
+        # Given
+        unit = parse.parse(self.CODE, index=True)
+
+        # Then
+        for path, node in unit:
+            nodes = [item for item in path if isinstance(item, ast.Node)]
+            self.assertIs(unit._index.parent(node), nodes[-1] if nodes else None)
+            self.assertEqual(list(unit._index.ancestors(node)), nodes[::-1])
+
+
+class TestNodeAt(unittest.TestCase):
+
+    CODE = """class A {
+    void f(int x) {
+        g(x + 1);
+        for (int i = 0; i < x; i++) { }
+    }
+}
+"""
+
+    def setUp(self):
+        self.unit = parse.parse(self.CODE, index=True)
+        self.index = self.unit._index
+
+    def test_innermost(self):
+        # When
+        literal = self.index.node_at(tokenizer.Position(3, 15))
+        invocation = self.index.node_at((3, 9))
+
+        # Then
+        self.assertIsInstance(literal, tree.Literal)
+        self.assertEqual(literal.value, '1')
+        self.assertIsInstance(invocation, tree.MethodInvocation)
+        self.assertEqual(invocation.member, 'g')
+
+    def test_between_nodes(self):
+        # When
+        plus = self.index.node_at((3, 13))
+        body = self.index.node_at((3, 1))
+
+        # Then
+        self.assertIsInstance(plus, tree.BinaryOperation)
+        self.assertIsInstance(body, tree.MethodDeclaration)
+
+    def test_outside(self):
+        self.assertIsNone(self.index.node_at((0, 1)))
+        self.assertIsNone(self.index.node_at((6, 2)))
+        self.assertIsNone(self.index.node_at((7, 1)))
+
+    def test_span_of_nodes_below(self):
+        # Given the declarators of a variable declared in a for statement,
+        # which lie outside the position of the declaration
+        declaration = list(self.unit.filter(tree.VariableDeclaration))[0][1]
+
+        # When
+        literal = self.index.node_at((4, 22))
+
+        # Then
+        self.assertIsInstance(literal, tree.Literal)
+        self.assertIs(self.index.enclosing(literal, tree.VariableDeclaration),
+                      declaration)
+
+    def test_do_statement_body(self):
+        # Given a body which comes after the condition in the attrs
+        unit = parse.parse("class A { void f() {\n"
+                           "    do { foo(); } while (x);\n"
+                           "} }", index=True)
+
+        # When
+        invocation = unit._index.node_at((2, 10))
+
+        # Then
+        self.assertIsInstance(invocation, tree.MethodInvocation)
+        self.assertEqual(invocation.member, 'foo')
+
+    def test_arguments_before_selectors(self):
+        # Given arguments which come after the selectors in the attrs
+        unit = parse.parse("class A { void f() {\n"
+                           "    b.add(bar(1)).build();\n"
+                           "} }", index=True)
+
+        # When
+        invocation = unit._index.node_at((2, 11))
+        literal = unit._index.node_at((2, 15))
+
+        # Then
+        self.assertEqual(invocation.member, 'bar')
+        self.assertIsInstance(literal, tree.Literal)
+
+    def test_class_header(self):
+        # Given type parameters and supertypes which come after the body in
+        # the attrs
+        unit = parse.parse("class A<T extends B> extends C implements D {\n"
+                           "    int x;\n"
+                           "}", index=True)
+
+        # When
+        parameter = unit._index.node_at((1, 9))
+        bound = unit._index.node_at((1, 19))
+        extended = unit._index.node_at((1, 30))
+        implemented = unit._index.node_at((1, 43))
+
+        # Then
+        self.assertIsInstance(parameter, tree.TypeParameter)
+        self.assertEqual(bound.name, 'B')
+        self.assertEqual(extended.name, 'C')
+        self.assertEqual(implemented.name, 'D')
+        self.assertIs(unit._index.parent(implemented), unit.types[0])
+
+    def test_enclosing(self):
+        # Given
+        method = self.unit.types[0].methods[0]
+        literal = self.index.node_at((3, 15))
+
+        # Then
+        self.assertIs(self.index.enclosing(literal, tree.MethodDeclaration),
+                      method)
+        self.assertIs(self.index.enclosing(method, tree.MethodDeclaration),
+                      method)
+        self.assertIsNone(self.index.enclosing(method, tree.Statement))
+
+
+if __name__=="__main__":
+    unittest.main()
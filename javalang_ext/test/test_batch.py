@@ -0,0 +1,140 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from .. import batch, tree
+from ..__main__ import main
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(__file__), 'source')
+
+
+def count_fields(compilation_unit):
+    return len(list(compilation_unit.filter(tree.FieldDeclaration)))
+
+def add(a, b):
+    return a + b
+
+def fail(compilation_unit):
+    raise ValueError('failed')
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+        self.write('A.java', "package a; class A { void f() { g(); } }")
+        self.write('b/B.java', "class B {" + " int x;" * 100 + " }")
+        self.write('b/Broken.java', "class Broken { void f( }")
+        self.write('b/notes.txt', "not java")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, code):
+        path = os.path.join(self.directory, name)
+
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+
+        with open(path, 'w') as source_file:
+            source_file.write(code)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_find_java_files(self):
+        # When
+        paths = list(batch.find_java_files([self.directory, 'Other.java']))
+
+        # Then
+        self.assertEqual(paths, [self.path('A.java'), self.path('b/B.java'),
+                                 self.path('b/Broken.java'), 'Other.java'])
+
+    def test_schedule(self):
+        # When
+        paths = batch.schedule(batch.find_java_files([self.directory]))
+
+        # Then
+        self.assertEqual(paths, [self.path('b/B.java'), self.path('A.java'),
+                                 self.path('b/Broken.java')])
+
+    def test_parse_files(self):
+        # When
+        results = dict((result.path, result)
+                       for result in batch.parse_files([self.directory], 2))
+
+        # Then
+        self.assertEqual(sorted(results), [self.path('A.java'),
+                                           self.path('b/B.java'),
+                                           self.path('b/Broken.java')])
+
+        a = results[self.path('A.java')]
+        self.assertIsInstance(a.tree, tree.CompilationUnit)
+        self.assertEqual(a.tree.package.name, 'a')
+        self.assertIsNone(a.error)
+
+        broken = results[self.path('b/Broken.java')]
+        self.assertIsNone(broken.tree)
+        self.assertTrue(broken.error.startswith('JavaSyntaxError at line 1'))
+
+    def test_missing_file(self):
+        # When
+        results = list(batch.parse_files([self.path('Missing.java')], 1))
+
+        # Then
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0].error.startswith(('IOError', 'FileNotFoundError')))
+
+    def test_outline(self):
+        # When
+        result, = batch.parse_files([self.path('A.java')], 1, outline=True)
+
+        # Then
+        self.assertEqual(result.tree.types[0].methods[0].body, [])
+
+    def test_map_files(self):
+        # When
+        results = dict((result.path, result) for result in
+                       batch.map_files([self.directory], count_fields, 2))
+
+        # Then
+        self.assertEqual(results[self.path('A.java')].value, 0)
+        self.assertEqual(results[self.path('b/B.java')].value, 100)
+        self.assertIsNone(results[self.path('b/Broken.java')].value)
+        self.assertTrue(results[self.path('b/Broken.java')].error)
+
+    def test_map_files_function_error(self):
+        # When
+        results = list(batch.map_files([self.path('A.java')], fail, 1))
+
+        # Then
+        self.assertEqual(results[0].error, 'ValueError: failed')
+
+    def test_reduce_files(self):
+        # When
+        value, errors = batch.reduce_files([self.directory], count_fields, add,
+                                           workers=2)
+
+        # Then
+        self.assertEqual(value, 100)
+        self.assertEqual([error.path for error in errors],
+                         [self.path('b/Broken.java')])
+
+    def test_reduce_files_initial(self):
+        # When
+        value, errors = batch.reduce_files([self.path('A.java')],
+                                           batch.type_names, add, [None], 1)
+
+        # Then
+        self.assertEqual(value, [None, 'A'])
+        self.assertEqual(errors, [])
+
+    def test_main(self):
+        self.assertEqual(main(['parse', '-j', '2', SOURCE_DIRECTORY]), 0)
+        self.assertEqual(main(['parse', '-j', '2', self.directory]), 1)
+
+
+if __name__=="__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from .. import tree
+from ..cache import ParseCache
+from ..parser import JavaSyntaxError
+
+
+class TestParseCache(unittest.TestCase):
+
+    CODE = "package a; class A { void f() { g(1); } }"
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_hit(self):
+        # Given
+        cache = ParseCache(self.directory)
+        expected = cache.parse(self.CODE)
+
+        # When
+        result = ParseCache(self.directory).parse(self.CODE)
+
+        # Then
+        self.assertIsInstance(result, tree.CompilationUnit)
+        self.assertEqual(repr(result), repr(expected))
+        self.assertEqual(cache.misses, 1)
+
+    def test_hit_rate(self):
+        # Given
+        cache = ParseCache(self.directory)
+
+        # When
+        cache.parse(self.CODE)
+        cache.parse(self.CODE)
+        cache.parse(self.CODE + " ")
+        cache.parse(self.CODE, outline=True)
+
+        # Then
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+        self.assertEqual(cache.hit_rate, 0.25)
+
+    def test_parse_str(self):
+        # Given
+        cache = ParseCache(self.directory)
+        cache.parse(self.CODE)
+
+        # When
+        unit = cache.parse_str(self.CODE)
+        statement = cache.parse_str("g(1);")
+        cached = cache.parse_str("g(1);")
+
+        # Then
+        self.assertIsInstance(unit, tree.CompilationUnit)
+        self.assertIsInstance(cached, tree.StatementExpression)
+        self.assertEqual(repr(cached), repr(statement))
+        self.assertEqual((cache.hits, cache.misses), (2, 2))
+        with self.assertRaises(JavaSyntaxError):
+            cache.parse_str("g(1);", guess_level=False)
+
+    def test_size_on_overwrite(self):
+        # Given
+        cache = ParseCache(self.directory)
+        key = cache.key(self.CODE)
+        tree = cache.parse(self.CODE)
+
+        # When another process has stored the same entry meanwhile
+        cache.put(key, tree)
+        cache.put(key, tree)
+
+        # Then
+        self.assertEqual(cache.size, cache.disk_usage())
+
+    def test_key(self):
+        cache = ParseCache(self.directory)
+
+        self.assertEqual(cache.key(self.CODE), cache.key(self.CODE.encode('utf-8')))
+        self.assertNotEqual(cache.key(self.CODE), cache.key(self.CODE, True))
+
+    def test_corrupt_entry(self):
+        # Given
+        cache = ParseCache(self.directory)
+        cache.parse(self.CODE)
+
+        with open(cache.path(cache.key(self.CODE)), 'wb') as cache_file:
+            cache_file.write(b'garbage')
+
+        # When
+        result = cache.parse(self.CODE)
+
+        # Then
+        self.assertIsInstance(result, tree.CompilationUnit)
+        self.assertEqual(cache.misses, 2)
+        self.assertIsNotNone(cache.get(cache.key(self.CODE)))
+
+    def test_syntax_error_not_cached(self):
+        # Given
+        cache = ParseCache(self.directory)
+
+        # Then
+        with self.assertRaises(JavaSyntaxError):
+            cache.parse("class A {")
+        self.assertEqual(list(cache.entries()), [])
+
+    def test_eviction(self):
+        # Given
+        cache = ParseCache(self.directory)
+        codes = ["class A%d { }" % (i,) for i in range(4)]
+
+        for i, code in enumerate(codes):
+            cache.parse(code)
+            os.utime(cache.path(cache.key(code)), (i, i))
+
+        # Reading marks an entry as recently used
+        cache.parse(codes[0])
+        entry_size = os.path.getsize(cache.path(cache.key(codes[1])))
+
+        # When
+        cache.max_size = entry_size * 3
+        cache.evict()
+
+        # Then
+        present = [os.path.exists(cache.path(cache.key(code))) for code in codes]
+        self.assertEqual(present, [True, False, False, True])
+        self.assertEqual(cache.size, cache.disk_usage())
+
+    def test_eviction_on_put(self):
+        # Given
+        cache = ParseCache(self.directory, max_size=1)
+
+        # When
+        cache.parse(self.CODE)
+
+        # Then
+        self.assertEqual(list(cache.entries()), [])
+        self.assertEqual(cache.size, 0)
+
+    def test_clear(self):
+        # Given
+        cache = ParseCache(self.directory)
+        cache.parse(self.CODE)
+
+        # When
+        cache.clear()
+
+        # Then
+        self.assertEqual(cache.disk_usage(), 0)
+        self.assertIsNone(cache.get(cache.key(self.CODE)))
+
+
+if __name__=="__main__":
+    unittest.main()
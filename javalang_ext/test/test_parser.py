@@ -0,0 +1,699 @@
+import pickle
+import unittest
+
+from .. import parse, parser, tokenizer, tree, util
+
+
+class TestMemoization(unittest.TestCase):
+
+    CODE = """
+class A {
+    void f() {
+        Runnable r = () -> { int x = (int) (a + b); };
+        list.forEach((a, b) -> ((String) a).length());
+        for (A a : (List<A>) items) { (a).b[0] = c; }
+        for (i = 0; i < n; i++) x = (y) -> (z);
+        b;
+    }
+}
+"""
+
+    def parse(self, memoize):
+        tokens = list(tokenizer.tokenize(self.CODE))
+        java_parser = parser.Parser(tokens, memoize=memoize)
+        return java_parser, java_parser.parse_compilation_unit()
+
+    def test_same_tree(self):
+        # Given
+        _, expected = self.parse(memoize=False)
+
+        # When
+        java_parser, tree = self.parse(memoize=True)
+
+        # Then
+        self.assertEqual(repr(tree), repr(expected))
+        self.assertTrue(java_parser.memo)
+
+    def test_cached_failure(self):
+        # Given an initializer which fails both as that of a declaration and
+        # as the right hand side of an assignment
+        tokens = list(tokenizer.tokenize("{ a<b> c = (x; }"))
+        java_parser = parser.Parser(tokens, memoize=True)
+
+        # Then
+        with self.assertRaises(parser.JavaSyntaxError):
+            java_parser.parse_block()
+        self.assertTrue(any(marker is None
+                            for _, marker in java_parser.memo.values()))
+
+    def test_avoids_repeated_work(self):
+        # Given statements which read as a declaration up to an error nested
+        # in their initializer, and are then read again as an assignment
+        code = ("class A { void f() { " + "a<b> c = () -> { " * 10 +
+                "x y z;" + " }; " * 10 + "} }")
+
+        def lambdas(memoize):
+            java_parser = parser.Parser(tokenizer.tokenize(code),
+                                        memoize=memoize)
+            parse_lambda_expression = java_parser.parse_lambda_expression
+            calls = []
+
+            def count():
+                calls.append(None)
+                return parse_lambda_expression()
+
+            java_parser.parse_lambda_expression = count
+            with self.assertRaises(parser.JavaSyntaxError):
+                java_parser.parse_compilation_unit()
+            return len(calls)
+
+        # Then each lambda is read twice as often as the one around it
+        # without the memo, and once with it
+        self.assertEqual(lambdas(memoize=False), 2 ** 11 - 2)
+        self.assertEqual(lambdas(memoize=True), 10)
+
+    def test_disabled_by_default(self):
+        # Given
+        java_parser, _ = self.parse(memoize=False)
+
+        # Then
+        self.assertIsNone(java_parser.memo)
+
+
+class TestParenthesisPrediction(unittest.TestCase):
+
+    def predict(self, code):
+        return parser.Parser(tokenizer.tokenize(code)).predict_parenthesis()
+
+    def test_lambda(self):
+        self.assertEqual(self.predict("(a, b) -> a"), 'lambda')
+        self.assertEqual(self.predict("(int a, final B b) -> a"), 'lambda')
+        self.assertEqual(self.predict("() -> a"), 'lambda')
+
+    def test_cast(self):
+        self.assertEqual(self.predict("(int) a"), 'cast')
+        self.assertEqual(self.predict("(List<? extends A>[]) a.b()"), 'cast')
+        self.assertEqual(self.predict("(A) (b)"), 'cast')
+        self.assertEqual(self.predict("(A) -b"), 'cast')
+
+    def test_primary(self):
+        self.assertEqual(self.predict("(a) -> a"), 'primary')
+        self.assertEqual(self.predict("(a + b) * c"), 'primary')
+        self.assertEqual(self.predict("(a).b"), 'primary')
+        self.assertEqual(self.predict("((a)) + b"), 'primary')
+        self.assertEqual(self.predict("(f(a)) + b"), 'primary')
+        self.assertEqual(self.predict("(a, b)"), 'primary')
+
+    def test_unknown(self):
+        self.assertIsNone(self.predict("(@A int a) -> a"))
+        self.assertIsNone(self.predict("(a" + ", a" * 100 + ") -> a"))
+
+    def test_parse(self):
+        # Given
+        expressions = ["(a, b) -> a", "(int) a", "(a) -> a", "(a + b) * c",
+                       "(A) -b", "(List<A>) (a).b", "(a b) c;"]
+
+        for expression in expressions:
+            # When
+            try:
+                result = repr(parser.Parser(
+                    tokenizer.tokenize(expression)).parse_expression())
+            except parser.JavaSyntaxError as e:
+                result = e.description
+
+            # Then
+            java_parser = parser.Parser(tokenizer.tokenize(expression))
+            java_parser.predict_parenthesis = lambda: None
+            try:
+                expected = repr(java_parser.parse_expression())
+            except parser.JavaSyntaxError as e:
+                expected = e.description
+
+            self.assertEqual(result, expected)
+
+
+class TestEntryLevel(unittest.TestCase):
+
+    SNIPPETS = [
+        ("package a.b;", 'CompilationUnit', tree.CompilationUnit),
+        ("@Deprecated public class A {}", 'CompilationUnit', tree.CompilationUnit),
+        ("int x = 1;", 'MemberDeclaration', tree.FieldDeclaration),
+        ("@Override public String f() { return s; }", 'MemberDeclaration',
+         tree.MethodDeclaration),
+        ("A(int a) throws E { }", 'MemberDeclaration', tree.ConstructorDeclaration),
+        ("<T> T f(T t) { return t; }", 'MemberDeclaration', tree.MethodDeclaration),
+        ("foo(a, b);", 'Statement', tree.StatementExpression),
+        ("a.b[0] = c;", 'Statement', tree.StatementExpression),
+        ("label: x++;", 'Statement', tree.StatementExpression),
+        ("synchronized (a) { }", 'Statement', tree.SynchronizedStatement),
+        ("if (a) { return; }", 'Statement', tree.IfStatement),
+    ]
+
+    def test_guess(self):
+        for code, level, node_type in self.SNIPPETS:
+            # Given
+            java_parser = parser.Parser(tokenizer.tokenize(code))
+
+            # When
+            node = java_parser.parse()
+
+            # Then
+            self.assertIsInstance(node, node_type, code)
+            self.assertEqual(java_parser.guessed_level, level, code)
+            self.assertFalse(java_parser.guess_fell_back, code)
+
+    def test_fall_back(self):
+        # Given
+        java_parser = parser.Parser(tokenizer.tokenize("class A {}"))
+        java_parser.guess_entry_level = lambda: 3
+
+        # When
+        node = java_parser.parse()
+
+        # Then
+        self.assertIsInstance(node, tree.CompilationUnit)
+        self.assertEqual(java_parser.guessed_level, 'Statement')
+        self.assertTrue(java_parser.guess_fell_back)
+
+
+class TestBinaryOperation(unittest.TestCase):
+
+    def parse(self, code):
+        return parser.Parser(tokenizer.tokenize(code)).parse_expression()
+
+    def test_precedence(self):
+        # Given
+        expression = self.parse("a || b && c | d + e * f - g == h")
+
+        # When
+        operators = list()
+        node = expression
+        while isinstance(node, tree.BinaryOperation):
+            operators.append(node.operator)
+            node = node.operandr
+
+        # Then
+        self.assertEqual(operators, ['||', '&&', '|', '=='])
+        self.assertEqual(expression.operandr.operandr.operandr.operandl.operator, '-')
+
+    def test_left_associative(self):
+        # Given
+        expression = self.parse("a - b - c")
+
+        # Then
+        self.assertEqual(expression.operator, '-')
+        self.assertEqual(expression.operandr.member, 'c')
+        self.assertEqual(expression.operandl.operandl.member, 'a')
+
+    def test_long_chain(self):
+        # Given
+        code = " + ".join("a%d" % i for i in range(100000))
+
+        # When
+        node = self.parse(code)
+
+        # Then
+        depth = 0
+        while isinstance(node, tree.BinaryOperation):
+            node = node.operandl
+            depth += 1
+        self.assertEqual(depth, 99999)
+        self.assertEqual(node.member, 'a0')
+
+
+class TestLazyBodies(unittest.TestCase):
+
+    CODE = """
+class A {
+    A() { super(); }
+    void f() { if (a) { g(new B() { void h() { } }); } }
+    int g(int x) { return x * 2; }
+    abstract void i();
+}
+"""
+
+    def parse(self, code, lazy_bodies):
+        tokens = list(tokenizer.tokenize(code))
+        return parser.Parser(tokens, lazy_bodies=lazy_bodies).parse_compilation_unit()
+
+    def test_deferred(self):
+        # When
+        unit = self.parse(self.CODE, lazy_bodies=True)
+
+        # Then
+        constructor = unit.types[0].constructors[0]
+        methods = unit.types[0].methods
+        self.assertEqual(constructor.deferred, set(['body']))
+        self.assertEqual([m.deferred for m in methods],
+                         [set(['body']), set(['body']), set()])
+        self.assertIsNone(methods[2].body)
+
+    def test_parsed_on_access(self):
+        # Given
+        unit = self.parse(self.CODE, lazy_bodies=True)
+        method = unit.types[0].methods[1]
+
+        # When
+        body = method.body
+
+        # Then
+        self.assertIsInstance(body[0], tree.ReturnStatement)
+        self.assertIs(method.body, body)
+        self.assertEqual(method.deferred, set())
+
+    def test_same_tree(self):
+        # Given
+        expected = self.parse(self.CODE, lazy_bodies=False)
+
+        # When
+        unit = self.parse(self.CODE, lazy_bodies=True)
+
+        # Then
+        self.assertEqual(repr(unit), repr(expected))
+
+    def test_pickle(self):
+        # Given
+        unit = self.parse(self.CODE, lazy_bodies=True)
+
+        # When
+        loaded = pickle.loads(pickle.dumps(unit))
+
+        # Then
+        self.assertEqual(repr(loaded), repr(self.parse(self.CODE, False)))
+
+    def test_error_on_access(self):
+        # Given
+        unit = self.parse("class A { void f() { int = ; } }", lazy_bodies=True)
+        method = unit.types[0].methods[0]
+
+        # Then
+        with self.assertRaises(parser.JavaSyntaxError):
+            method.body
+        with self.assertRaises(parser.JavaSyntaxError):
+            method.body
+        self.assertEqual(method.deferred, set(['body']))
+
+    def test_positions(self):
+        # Given
+        expected = self.parse(self.CODE, lazy_bodies=False)
+
+        # When
+        unit = self.parse(self.CODE, lazy_bodies=True)
+
+        # Then
+        self.assertEqual([node.position for _, node in unit],
+                         [node.position for _, node in expected])
+
+    def test_tokens_released(self):
+        # Given
+        tokens = list(tokenizer.tokenize(self.CODE))
+
+        # When
+        unit = parser.Parser(tokens, lazy_bodies=True).parse_compilation_unit()
+
+        # Then only the text is kept, which the tokens share
+        method = unit.types[0].methods[0]
+        functions = [method._get_deferred()['body'].function]
+        while functions:
+            for cell in functions.pop().__closure__ or ():
+                self.assertNotIsInstance(cell.cell_contents, list)
+                if hasattr(cell.cell_contents, '__closure__'):
+                    functions.append(cell.cell_contents)
+        self.assertIsInstance(method.body[0], tree.IfStatement)
+
+    def test_tokens_without_source(self):
+        # Given
+        tokens = list(tokenizer.tokenize(self.CODE))
+        for token in tokens:
+            token.position = token.position
+            token.source = None
+
+        # When
+        unit = parser.Parser(tokens, lazy_bodies=True).parse_compilation_unit()
+
+        # Then
+        self.assertEqual(repr(unit), repr(self.parse(self.CODE, False)))
+
+    def test_unbalanced(self):
+        with self.assertRaises(parser.JavaSyntaxError):
+            self.parse("class A { void f() { { }", lazy_bodies=True)
+
+
+class TestOutline(unittest.TestCase):
+
+    CODE = """
+package a;
+
+/** Docs */
+@Entity
+public class A<T> extends B implements C {
+    static { init(); }
+    Map<K, V> m = new HashMap<K, V>(), n = f(a, b);
+    int[] xs = { 1, 2 }, ys;
+    public A(int a) throws E { super(a); }
+    @Override <R> R f(List<? extends T> ts) { return g(new Object() { }); }
+    abstract void g();
+    enum E { X(1, h(2)) { void k() { } }, Y }
+    interface I { int C = 1 + 2; default void d() { } }
+}
+"""
+
+    def test_declarations(self):
+        # When
+        unit = parse.parse(self.CODE, outline=True)
+
+        # Then
+        declaration = unit.types[0]
+        self.assertEqual(declaration.documentation, '/** Docs */')
+        self.assertEqual(declaration.annotations[0].name, 'Entity')
+        self.assertEqual([type(member).__name__ for member in declaration.body],
+                         ['BlockStatement', 'FieldDeclaration', 'FieldDeclaration',
+                          'ConstructorDeclaration', 'MethodDeclaration',
+                          'MethodDeclaration', 'EnumDeclaration',
+                          'InterfaceDeclaration'])
+        self.assertEqual(declaration.methods[0].parameters[0].type.name, 'List')
+        self.assertEqual(declaration.constructors[0].throws, ['E'])
+
+    def test_skipped(self):
+        # When
+        unit = parse.parse(self.CODE, outline=True)
+
+        # Then
+        declaration = unit.types[0]
+        self.assertEqual(declaration.body[0].statements, [])
+        self.assertEqual([d.name for d in declaration.body[1].declarators],
+                         ['m', 'n'])
+        self.assertEqual([d.initializer for d in declaration.body[1].declarators],
+                         [None, None])
+        self.assertEqual(declaration.body[2].declarators[0].initializer, None)
+        self.assertEqual(declaration.constructors[0].body, [])
+        self.assertEqual(declaration.methods[0].body, [])
+        self.assertIsNone(declaration.methods[1].body)
+
+        constant = declaration.body[6].body.constants[0]
+        self.assertEqual(constant.arguments, [])
+        self.assertEqual(constant.body[0].name, 'k')
+
+        interface = declaration.body[7]
+        self.assertIsNone(interface.body[0].declarators[0].initializer)
+        self.assertEqual(interface.body[1].body, [])
+
+    def test_no_expressions(self):
+        # When
+        unit = parse.parse(self.CODE, outline=True)
+
+        # Then
+        statements = [node for _, node in unit.filter(tree.Statement)]
+        self.assertEqual(statements, [unit.types[0].body[0]])
+        self.assertEqual(list(unit.filter(tree.Expression)), [])
+
+    def test_declarators_not_parsed(self):
+        # Given a parser which fails on any variable initializer it parses
+        class OutlineParser(parser.Parser):
+            def parse_variable_initializer_contents(self):
+                raise AssertionError('Initializer parsed')
+
+        code = """class A {
+            Map<K, V> m = new HashMap<K, V>();
+            int a = 1, b = 2;
+            T<A, B, C> t = new T<A, B, C>(), u, v = x < y, w[] = {1, 2};
+            boolean p = a < b, q;
+            int[] z = f(a, b), zz[];
+        }"""
+
+        # When
+        unit = OutlineParser(tokenizer.tokenize(code),
+                             outline=True).parse_compilation_unit()
+
+        # Then
+        self.assertEqual([[d.name for d in field.declarators]
+                          for field in unit.types[0].fields],
+                         [['m'], ['a', 'b'], ['t', 'u', 'v', 'w'], ['p', 'q'],
+                          ['z', 'zz']])
+        self.assertEqual(unit.types[0].fields[2].declarators[3].dimensions,
+                         [None])
+
+    def test_unbalanced(self):
+        with self.assertRaises(parser.JavaSyntaxError):
+            parse.parse("class A { void f() { ( }", outline=True)
+
+
+class TestHeader(unittest.TestCase):
+
+    def test_header(self):
+        # Given
+        code = """
+package a.b;
+
+import java.util.*;
+import static c.D.e;
+
+/** Docs */
+@Entity
+public final class A<T> extends B {
+    int x;
+}
+"""
+
+        # When
+        unit = parse.parse_header(code)
+
+        # Then
+        self.assertEqual(unit.package.name, 'a.b')
+        self.assertEqual([(i.path, i.static, i.wildcard) for i in unit.imports],
+                         [('java.util', False, True), ('c.D.e', True, False)])
+        self.assertEqual(len(unit.types), 1)
+        self.assertIsInstance(unit.types[0], tree.ClassDeclaration)
+        self.assertEqual(unit.types[0].name, 'A')
+        self.assertEqual(unit.types[0].modifiers, set(['public', 'final']))
+        self.assertEqual(unit.types[0].annotations[0].name, 'Entity')
+        self.assertEqual(unit.types[0].documentation, '/** Docs */')
+        self.assertIsNone(unit.types[0].body)
+
+    def test_positions(self):
+        # Given
+        code = "package a;\n\n@Entity\npublic class A<T> extends B {\n}\n"
+        full = parse.parse(code)
+
+        # When
+        unit = parse.parse_header(code)
+
+        # Then the nodes start where they do in the full tree, and the type
+        # ends after its name
+        self.assertEqual(unit.position[0], full.position[0])
+        self.assertEqual(unit.package.position, full.package.position)
+        self.assertEqual(unit.types[0].position,
+                         (full.types[0].position[0], tokenizer.Position(4, 15)))
+        self.assertEqual(unit.types[0].annotations[0].position,
+                         full.types[0].annotations[0].position)
+
+    def test_declaration_types(self):
+        for code, declaration_type in [
+                ("; enum A { }", tree.EnumDeclaration),
+                ("interface A { }", tree.InterfaceDeclaration),
+                ("@interface A { }", tree.AnnotationDeclaration)]:
+            # When
+            unit = parse.parse_header(code)
+
+            # Then
+            self.assertIsInstance(unit.types[0], declaration_type)
+
+    def test_no_types(self):
+        # When
+        unit = parse.parse_header("package a;")
+
+        # Then
+        self.assertEqual(unit.package.name, 'a')
+        self.assertEqual(unit.types, [])
+
+    def test_stops_after_name(self):
+        # Given
+        tokens = util.LazyList(tokenizer.tokenize("class A { # }"))
+
+        # When
+        unit = parser.Parser(tokens).parse_header()
+
+        # Then
+        self.assertEqual(unit.types[0].name, 'A')
+        self.assertEqual(len(tokens.values), 2)
+
+
+class TestReparse(unittest.TestCase):
+
+    CODE = """package a;
+
+class A {
+    int x = 1;
+
+    void f() {
+        g(1);
+    }
+
+    class B {
+        int y;
+        void h() { }
+    }
+
+    A() { }
+}
+"""
+
+    def reparse(self, code, offset, deleted, inserted):
+        tokens = list(tokenizer.tokenize(code))
+        compilation_unit = parser.Parser(tokens).parse_compilation_unit()
+
+        new_code = code[:offset] + inserted + code[offset + deleted:]
+        edit = tokenizer.Edit(offset, deleted, inserted)
+        result, new_tokens = parse.reparse(compilation_unit, tokens, edit,
+                                           new_code)
+
+        expected = parser.Parser(tokenizer.tokenize(new_code)).parse_compilation_unit()
+        self.assertEqual(repr(result), repr(expected))
+        self.assertEqual(self.positions(result), self.positions(expected))
+
+        return compilation_unit, result
+
+    def positions(self, compilation_unit):
+        return [(type(node).__name__, node.position)
+                for _, node in compilation_unit]
+
+    def test_edit_in_method(self):
+        # Given
+        offset = self.CODE.index("g(1)")
+
+        # When
+        old, new = self.reparse(self.CODE, offset, 4, "g(2);\n        k(x)")
+
+        # Then
+        self.assertIs(new, old)
+        self.assertEqual(len(new.types[0].methods[0].body), 2)
+
+    def test_edit_in_nested_member(self):
+        # Given
+        offset = self.CODE.index("int y")
+
+        # When
+        old, new = self.reparse(self.CODE, offset, 5, "long z")
+
+        # Then
+        self.assertIs(new, old)
+        self.assertEqual(new.types[0].body[2].body[0].declarators[0].name, 'z')
+
+    def test_reuses_other_members(self):
+        # Given
+        tokens = list(tokenizer.tokenize(self.CODE))
+        compilation_unit = parser.Parser(tokens).parse_compilation_unit()
+        field, method, nested, constructor = compilation_unit.types[0].body
+
+        offset = self.CODE.index("g(1)")
+        code = self.CODE[:offset] + "\n\n" + self.CODE[offset:]
+
+        # When
+        result, _ = parse.reparse(compilation_unit, tokens,
+                                  tokenizer.Edit(offset, 0, "\n\n"), code)
+
+        # Then
+        body = result.types[0].body
+        self.assertIs(body[0], field)
+        self.assertIsNot(body[1], method)
+        self.assertIs(body[2], nested)
+        self.assertIs(body[3], constructor)
+        self.assertEqual(constructor.position[0].line, 17)
+
+    def test_changes_tree_in_place(self):
+        # Given
+        tokens = list(tokenizer.tokenize(self.CODE))
+        compilation_unit = parser.Parser(tokens).parse_compilation_unit()
+        body = compilation_unit.types[0].body
+        method, constructor = body[1], body[3]
+        old_tokens = [(token.value, token.position) for token in tokens]
+
+        offset = self.CODE.index("g(1)")
+        code = self.CODE[:offset] + "k();\n" + self.CODE[offset:]
+
+        # When
+        result, _ = parse.reparse(compilation_unit, tokens,
+                                  tokenizer.Edit(offset, 0, "k();\n"), code)
+
+        # Then the tree passed in now describes the new text
+        self.assertIs(result, compilation_unit)
+        self.assertIs(compilation_unit.types[0].body, body)
+        self.assertIsNot(body[1], method)
+        self.assertEqual(len(body[1].body), 2)
+        self.assertEqual(len(method.body), 1)
+        self.assertEqual(constructor.position[0].line, 16)
+        self.assertEqual([(token.value, token.position) for token in tokens],
+                         old_tokens)
+
+    def test_new_tree_leaves_old_one(self):
+        # Given
+        tokens = list(tokenizer.tokenize(self.CODE))
+        compilation_unit = parser.Parser(tokens).parse_compilation_unit()
+        before = (repr(compilation_unit), self.positions(compilation_unit))
+
+        offset = self.CODE.index("A {")
+        code = self.CODE[:offset] + "C" + self.CODE[offset + 1:]
+
+        # When
+        result, _ = parse.reparse(compilation_unit, tokens,
+                                  tokenizer.Edit(offset, 1, "C"), code)
+
+        # Then
+        self.assertIsNot(result, compilation_unit)
+        self.assertEqual((repr(compilation_unit),
+                          self.positions(compilation_unit)), before)
+
+    def test_edit_across_members(self):
+        # Given
+        offset = self.CODE.index("}\n\n    class")
+
+        # When
+        old, new = self.reparse(self.CODE, offset, 1, "} int z;")
+
+        # Then
+        self.assertIsNot(new, old)
+        self.assertEqual(len(new.types[0].body), 5)
+
+    def test_index(self):
+        # Given
+        tokens = list(tokenizer.tokenize(self.CODE))
+        compilation_unit = parser.Parser(tokens, index=True).parse_compilation_unit()
+
+        offset = self.CODE.index("g(1)")
+        code = self.CODE[:offset] + "k(); " + self.CODE[offset:]
+
+        # When
+        result, _ = parse.reparse(compilation_unit, tokens,
+                                  tokenizer.Edit(offset, 0, "k(); "), code)
+
+        # Then
+        self.assertIs(result._index.root, result)
+        self.assertEqual([node.member for _, node
+                          in result.filter(tree.MethodInvocation)], ['k', 'g'])
+
+    def test_edit_in_header(self):
+        # Given
+        offset = self.CODE.index("A {")
+
+        # When
+        old, new = self.reparse(self.CODE, offset, 1, "C")
+
+        # Then
+        self.assertIsNot(new, old)
+        self.assertEqual(new.types[0].name, 'C')
+
+    def test_syntax_error(self):
+        # Given
+        tokens = list(tokenizer.tokenize(self.CODE))
+        compilation_unit = parser.Parser(tokens).parse_compilation_unit()
+        offset = self.CODE.index("g(1)")
+        code = self.CODE[:offset] + "(" + self.CODE[offset:]
+
+        # Then
+        with self.assertRaises(parser.JavaSyntaxError):
+            parse.reparse(compilation_unit, tokens,
+                          tokenizer.Edit(offset, 0, "("), code)
+
+
+if __name__=="__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
+import unicodedata
 import unittest
-from .. import tokenizer
+
+from pkg_resources import resource_string
+from .. import parser, tokenizer
 
 
 class TestTokenizer(unittest.TestCase):
@@ -188,5 +191,283 @@ int k;
         self.assertEqual(token[0].position.column, 1)
         self.assertEqual(token[3].position.column, 1)
 
+    def test_position_is_resolved_lazily(self):
+        # Given
+        code = "int a;\n  b = 2;"
+
+        # When
+        tokens = list(tokenizer.tokenize(code))
+
+        # Then
+        self.assertIsNone(tokens[3]._position)
+        self.assertEqual(tokens[3].offset, 9)
+        self.assertEqual(tokens[3].position, (2, 3))
+        self.assertEqual(tokens[3]._position, (2, 3))
+
+    def test_position_after_multiline_string(self):
+        # Given
+        code = "a = 'x\ny'; b"
+
+        # When
+        tokens = list(tokenizer.tokenize(code, ignore_errors=True))
+
+        # Then
+        self.assertEqual(tokens[-1].value, "b")
+        self.assertEqual(tokens[-1].position, (2, 5))
+
+    def test_no_unicode_escapes_keeps_input(self):
+        # Given
+        code = u"int a = 1;"
+        tokenizer_ = tokenizer.JavaTokenizer(code)
+
+        # When
+        tokens = list(tokenizer_.tokenize())
+
+        # Then
+        self.assertIs(tokenizer_.data, code)
+        self.assertIsNone(tokenizer_.offset_map)
+        self.assertEqual(tokens[-1].position, (1, 10))
+
+    def test_unicode_escape_offsets_refer_to_original(self):
+        # Given
+        code = "char c = '\\u0041';\nint \\u0062x = 1;"
+
+        # When
+        tokens = list(tokenizer.tokenize(code))
+
+        # Then
+        self.assertEqual(tokens[3].value, "'A'")
+        self.assertEqual(code[tokens[3].offset:tokens[3].end], "'\\u0041'")
+        self.assertEqual(tokens[6].value, "bx")
+        self.assertEqual(code[tokens[6].offset:tokens[6].end], "\\u0062x")
+        self.assertEqual(tokens[6].position, (2, 5))
+        self.assertEqual(tokens[7].position, (2, 13))
+
+    def test_unicode_escape_at_end_of_input(self):
+        # Given
+        code = "a\\u"
+
+        # When
+        tokens = list(tokenizer.tokenize(code, ignore_errors=True))
+
+        # Then
+        self.assertEqual([t.value for t in tokens], ["a", "u"])
+
+    def test_invalid_unicode_escape_ignored(self):
+        # Given
+        code = "a \\uZZZZ b"
+
+        # When
+        tokens = list(tokenizer.tokenize(code, ignore_errors=True))
+
+        # Then
+        self.assertEqual([t.value for t in tokens], ["a", "uZZZZ", "b"])
+        self.assertEqual(tokens[-1].position, (1, 10))
+
+    def test_longest_match_symbols(self):
+        # Given
+        code = "a>>>=b>>=c<<=d...e..f->g::h.i"
+
+        # When
+        tokens = list(tokenizer.tokenize(code))
+
+        # Then
+        self.assertEqual([t.value for t in tokens],
+                         ["a", ">>>=", "b", ">>=", "c", "<<=", "d", "...", "e",
+                          ".", ".", "f", "->", "g", "::", "h", ".", "i"])
+        self.assertEqual(type(tokens[7]), tokenizer.Operator)
+        self.assertEqual(type(tokens[9]), tokenizer.Separator)
+
+    def test_ascii_identifier_tables(self):
+        tk = tokenizer.JavaTokenizer
+        for c in map(chr, range(128)):
+            category = unicodedata.category(c)
+            self.assertEqual(c in tk.ASCII_IDENT_START, category in tk.IDENT_START_CATEGORIES)
+            self.assertEqual(c in tk.ASCII_IDENT_PART, category in tk.IDENT_PART_CATEGORIES)
+            self.assertEqual(tk.ascii_ident_part_consumer.match(c).end() == 1,
+                             c in tk.ASCII_IDENT_PART)
+
+    def test_non_ascii_identifier(self):
+        # Given
+        code = "caf\u00e9_1 = na\u00efve\u0301x$ + \u03bb;"
+
+        # When
+        tokens = list(tokenizer.tokenize(code))
+
+        # Then
+        self.assertEqual([t.value for t in tokens],
+                         ["caf\u00e9_1", "=", "na\u00efve\u0301x$", "+", "\u03bb", ";"])
+        self.assertEqual(type(tokens[2]), tokenizer.Identifier)
+
+
+class TestRegexEngine(unittest.TestCase):
+
+    SNIPPETS = [
+        "package a.b; import static java.util.*; class A<T extends B & C> {}",
+        "/** doc */ @Override public int f(int... xs) { return xs.length; }",
+        "int x = a >>>= 2; y >>= 1; z <<= 3; a->b; A::new; i++ + --j;",
+        'String s = "a\\"b\\n\\u0041\\101"; char c = \'\\\'\';',
+        "double d = 1.5e-3 + .5f + 0x1.8p1 + 0X1F + 0b1010L + 017 + 1_000_000;",
+        "x..y ... .5 1. 1.e3 1__2 1_ 3L 0xL",
+        "\u00e9t\u00e9 = caf\u00e9 + na\u00efve; $a_b = _c$;",
+        "int /* block */ j; // line\nint k; /* multi\nline */ l;",
+        "\tfoo\r\n\f bar\u00a0baz",
+        "a /*/ still comment */ b",
+    ]
+
+    ERRORS = [
+        "int # x;",
+        '"unterminated',
+        '"bad \\q escape"',
+        "/* unterminated comment",
+        "x = 0x1.2;",
+    ]
+
+    def assert_same_tokens(self, code, ignore_errors=False):
+        def run(engine):
+            try:
+                return [(type(t), t.value, t.position, t.javadoc)
+                        for t in tokenizer.tokenize(code, ignore_errors, engine=engine)]
+            except tokenizer.LexerError as e:
+                return str(e)
+
+        self.assertEqual(run('default'), run('regex'))
+
+    def test_snippets(self):
+        for code in self.SNIPPETS:
+            self.assert_same_tokens(code)
+
+    def test_errors(self):
+        for code in self.ERRORS:
+            self.assert_same_tokens(code)
+            self.assert_same_tokens(code, ignore_errors=True)
+
+    def test_source_files(self):
+        for name in ("AnnotationJavadoc", "AnnotationOnly", "JavadocAnnotation",
+                     "JavadocOnly", "NoAnnotationNoJavadoc"):
+            code = resource_string(__name__, "source/package-info/%s.java" % name)
+            self.assert_same_tokens(code)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            tokenizer.tokenize("int x;", engine="unknown")
+
+class TestRetokenize(unittest.TestCase):
+
+    CODE = ("class A {\n"
+            "    int f(int.. x) { return a>>>b; }\n"
+            "    int g() { return 1; }\n"
+            "}\n")
+
+    def assert_retokenized(self, offset, deleted, inserted):
+        tokens = list(tokenizer.tokenize(self.CODE))
+        code = self.CODE[:offset] + inserted + self.CODE[offset + deleted:]
+
+        edit = tokenizer.Edit(offset, deleted, inserted)
+        result = tokenizer.retokenize(tokens, edit, code)
+
+        def key(tokens):
+            return [(type(t), t.value, t.offset, t.end, t.position, t.javadoc,
+                     t.source.data) for t in tokens]
+
+        self.assertEqual(key(result), key(tokenizer.tokenize(code)))
+
+        # The old tokens still describe the old text
+        self.assertEqual(key(tokens), key(tokenizer.tokenize(self.CODE)))
+        return tokens, result
+
+    def test_edit_inside_identifier(self):
+        offset = self.CODE.index("return a") + len("return a")
+        self.assert_retokenized(offset, 0, "bc")
+
+    def test_edit_joins_adjacent_symbols(self):
+        offset = self.CODE.index(".. x") + 2
+        self.assert_retokenized(offset, 0, ".")
+        self.assert_retokenized(offset + 3, 0, "=")
+
+    def test_edit_adds_comments(self):
+        offset = self.CODE.index("int g")
+        self.assert_retokenized(offset, 0, "/** doc */ ")
+        self.assert_retokenized(offset - 1, 1, "/* int h; */ /** doc */\n")
+
+    def test_edit_adds_lines(self):
+        # Given
+        offset = self.CODE.index("{")
+
+        # When
+        tokens, result = self.assert_retokenized(offset, 1, "{\n\n")
+
+        # Then
+        self.assertEqual(result[-1].position, (6, 1))
+        self.assertEqual(tokens[-1].position, (4, 1))
+        self.assertIs(result[0].source, result[-1].source)
+        self.assertIsNot(result[0].source, tokens[0].source)
+
+    def test_escapes_fall_back_to_tokenize(self):
+        offset = self.CODE.index("a>>>b")
+        self.assert_retokenized(offset, 1, "\\u0061")
+
+
+class TestCompactTokenStream(unittest.TestCase):
+
+    CODE = ("/** doc */\npackage a;\n"
+            "class A {\n"
+            "    int x = 1 >>>= 2; // trailing\n"
+            "    /** method */\n"
+            "    void f() { return \"\\n\"; }\n"
+            "}\n")
+
+    def test_matches_tokenize(self):
+        # Given
+        expected = list(tokenizer.tokenize(self.CODE))
+
+        # When
+        stream = tokenizer.tokenize_compact(self.CODE)
+
+        # Then
+        self.assertEqual(len(stream), len(expected))
+        self.assertEqual(
+            [(type(t), t.value, t.position, t.javadoc) for t in stream],
+            [(type(t), t.value, t.position, t.javadoc) for t in expected])
+
+    def test_indexing(self):
+        # Given
+        stream = tokenizer.tokenize_compact(self.CODE)
+
+        # When
+        first = stream[0]
+
+        # Then
+        self.assertIs(first, stream[0])
+        self.assertEqual(stream[-1].value, "}")
+        self.assertEqual([t.value for t in stream[1:3]], ["a", ";"])
+        with self.assertRaises(IndexError):
+            stream[len(stream)]
+
+    def test_unicode_escapes(self):
+        # Given
+        code = "int \\u0062 = 1;\nchar c = '\\u0041';"
+
+        # When
+        stream = tokenizer.tokenize_compact(code)
+
+        # Then
+        expected = list(tokenizer.tokenize(code))
+        self.assertEqual(
+            [(t.value, t.offset, t.end, t.position) for t in stream],
+            [(t.value, t.offset, t.end, t.position) for t in expected])
+
+    def test_parser_accepts_stream(self):
+        # Given
+        stream = tokenizer.tokenize_compact(self.CODE)
+
+        # When
+        tree = parser.Parser(stream).parse()
+
+        # Then
+        expected = parser.Parser(tokenizer.tokenize(self.CODE)).parse()
+        self.assertEqual(repr(tree), repr(expected))
+
+
 if __name__=="__main__":
     unittest.main()
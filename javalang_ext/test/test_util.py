@@ -1,6 +1,6 @@
 import unittest
 
-from ..util import LookAheadIterator
+from ..util import LazyList, LookAheadIterator, LookAheadListIterator
 
 
 class TestLookAheadIterator(unittest.TestCase):
@@ -65,5 +65,41 @@ class TestLookAheadIterator(unittest.TestCase):
         self.assertEqual(next(i), 14)
 
 
+class TestLookAheadListIterator(unittest.TestCase):
+    def test_nested_markers(self):
+        i = LookAheadListIterator(list(range(0, 20)))
+
+        i.push_marker() #1
+        self.assertEqual(next(i), 0)
+        i.push_marker() #2
+        self.assertEqual(next(i), 1)
+        self.assertEqual(next(i), 2)
+        i.pop_marker(False) #2
+        self.assertEqual(next(i), 3)
+        i.pop_marker(True) #1
+
+        self.assertEqual(next(i), 0)
+
+        with i:
+            self.assertEqual(next(i), 1)
+            with i:
+                self.assertEqual(next(i), 2)
+        self.assertEqual(next(i), 3)
+
+
+class TestLazyList(unittest.TestCase):
+    def test_usage(self):
+        values = iter(range(0, 10))
+        i = LazyList(values)
+
+        self.assertEqual(i[2], 2)
+        self.assertEqual(len(i.values), 3)
+        self.assertEqual(i[3], 3)
+        self.assertEqual(len(i.values), 4)
+        self.assertRaises(IndexError, lambda: i[10])
+        self.assertEqual(i[-1], 9)
+        self.assertEqual(len(i), 10)
+
+
 if __name__=="__main__":
     unittest.main()
@@ -1,4 +1,7 @@
+import array
+import bisect
 import re
+import string
 import unicodedata
 from collections import namedtuple
 
@@ -10,12 +13,77 @@ class LexerError(Exception):
 
 Position = namedtuple('Position', ['line', 'column'])
 
+class LineIndex(object):
+    """ Line start offsets of a piece of source text, built on first use, for
+    turning character offsets into Positions.
+
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self._line_starts = None
+
+    @property
+    def line_starts(self):
+        if self._line_starts is None:
+            line_starts = [0]
+            line_starts.extend(m.end() for m in re.finditer('\n', self.data))
+            self._line_starts = line_starts
+
+        return self._line_starts
+
+    def position(self, offset):
+        line_starts = self.line_starts
+        line = bisect.bisect_right(line_starts, offset)
+
+        # Rows and columns both start at 1
+        return Position(line, offset - line_starts[line - 1] + 1)
+
+class OffsetMap(object):
+    """ Maps offsets in unescaped text back to the original text. Only the
+    unicode escapes are recorded: the unescaped offset of each one and the
+    total number of characters removed up to and including it.
+
+    """
+
+    def __init__(self):
+        self.offsets = array.array('l')
+        self.shifts = array.array('l')
+
+    def add(self, offset, length):
+        shift = self.shifts[-1] if self.shifts else 0
+
+        self.offsets.append(offset)
+        self.shifts.append(shift + length - 1)
+
+    def original(self, offset):
+        k = bisect.bisect_left(self.offsets, offset)
+        return offset + self.shifts[k - 1] if k else offset
+
 class JavaToken(object):
-    def __init__(self, value, position=None, javadoc=None):
+    def __init__(self, value, position=None, javadoc=None, offset=None,
+                 end=None, source=None):
         self.value = value
-        self.position = position
+        self._position = position
         self.javadoc = javadoc
 
+        # Span of the token in the original text of source
+        self.offset = offset
+        self.end = end
+        self.source = source
+
+    @property
+    def position(self):
+        # Resolved from the offset on first access
+        if self._position is None and self.source is not None:
+            self._position = self.source.position(self.offset)
+
+        return self._position
+
+    @position.setter
+    def position(self, position):
+        self._position = position
+
     def __repr__(self):
         if self.position:
             return '%s "%s" line %d, position %d' % (
@@ -143,25 +211,53 @@ class Identifier(JavaToken):
     pass
 
 
+def build_symbol_trie(symbol_types):
+    """ Compile a mapping of operator/separator strings to token types into a
+    character trie. Each node maps a character to a (token type, children)
+    pair, where the token type is None if no symbol ends at that character.
+
+    """
+
+    trie = dict()
+
+    for symbol, token_type in symbol_types.items():
+        node = trie
+        for k, c in enumerate(symbol):
+            entry = node.setdefault(c, [None, dict()])
+            if k == len(symbol) - 1:
+                entry[0] = token_type
+            node = entry[1]
+
+    return trie
+
 class JavaTokenizer(object):
 
     IDENT_START_CATEGORIES = set(['Lu', 'Ll', 'Lt', 'Lm', 'Lo', 'Nl', 'Pc', 'Sc'])
 
     IDENT_PART_CATEGORIES = set(['Lu', 'Ll', 'Lt', 'Lm', 'Lo', 'Mc', 'Mn', 'Nd', 'Nl', 'Pc', 'Sc'])
 
+    # The ASCII members of the categories above. Identifiers are looked up in
+    # these directly and only non-ASCII code points consult unicodedata
+    ASCII_IDENT_START = set(string.ascii_letters + '_$')
+
+    ASCII_IDENT_PART = set(string.ascii_letters + string.digits + '_$')
+
+    ascii_ident_part_consumer = re.compile(r'[A-Za-z0-9_$]*')
+
+    SYMBOL_TYPES = dict([(v, Operator) for v in Operator.VALUES] +
+                        [(v, Separator) for v in Separator.VALUES])
+
+    SYMBOL_TRIE = build_symbol_trie(SYMBOL_TYPES)
+
     def __init__(self, data, ignore_errors=False):
         self.data = data
         self.ignore_errors = ignore_errors
         self.errors = []
 
-        # Rows and columns both start at 1
-        self.current_line = 1
-        self.start_of_line = -1
-
-        self.operators = [set() for i in range(0, Operator.MAX_LEN)]
-
-        for v in Operator.VALUES:
-            self.operators[len(v) - 1].add(v)
+        # Line index of the original input and the map from offsets in
+        # self.data to offsets in it, set up by pre_tokenize()
+        self.source = None
+        self.offset_map = None
 
         self.whitespace_consumer = re.compile(r'[^\s]')
 
@@ -179,15 +275,7 @@ class JavaTokenizer(object):
             self.i = self.length
             return
 
-        i = match.start()
-
-        start_of_line = self.data.rfind('\n', self.i, i)
-
-        if start_of_line != -1:
-            self.start_of_line = start_of_line
-            self.current_line += self.data.count('\n', self.i, i)
-
-        self.i = i
+        self.i = match.start()
 
     def read_string(self):
         delim = self.data[self.i]
@@ -238,12 +326,33 @@ class JavaTokenizer(object):
 
         self.j = j + 1
 
-    def try_operator(self):
-        for l in range(min(self.length - self.i, Operator.MAX_LEN), 0, -1):
-            if self.data[self.i:self.i + l] in self.operators[l - 1]:
-                self.j = self.i + l
-                return True
-        return False
+    def read_symbol(self):
+        """ Find the longest operator or separator at the current offset by
+        walking SYMBOL_TRIE. Returns its token type, or None if there is none.
+
+        """
+
+        data = self.data
+        length = self.length
+        node = self.SYMBOL_TRIE
+        token_type = None
+        j = self.i
+
+        while j < length:
+            entry = node.get(data[j])
+
+            if entry is None:
+                break
+
+            j += 1
+
+            if entry[0] is not None:
+                token_type = entry[0]
+                self.j = j
+
+            node = entry[1]
+
+        return token_type
 
     def read_comment(self):
         if self.data[self.i + 1] == '/':
@@ -264,12 +373,6 @@ class JavaTokenizer(object):
             return partial_comment
 
         comment = self.data[self.i:i]
-        start_of_line = self.data.rfind('\n', self.i, i)
-
-        if start_of_line != -1:
-            self.start_of_line = start_of_line
-            self.current_line += self.data.count('\n', self.i, i)
-
         self.i = i
 
         return comment
@@ -378,12 +481,6 @@ class JavaTokenizer(object):
         else:
             return self.read_decimal_float_or_integer()
 
-    def try_separator(self):
-        if self.data[self.i] in Separator.VALUES:
-            self.j = self.i + 1
-            return True
-        return False
-
     def decode_data(self):
         # Encodings to try in order
         codecs = ['utf_8', 'iso-8859-1']
@@ -402,15 +499,24 @@ class JavaTokenizer(object):
         self.error('Could not decode input data')
 
     def is_java_identifier_start(self, c):
+        if c < '\x80':
+            return c in self.ASCII_IDENT_START
+
         return unicodedata.category(c) in self.IDENT_START_CATEGORIES
 
     def read_identifier(self):
-        self.j = self.i + 1
+        match = self.ascii_ident_part_consumer.match
+        j = match(self.data, self.i + 1).end()
 
-        while self.j < len(self.data) and unicodedata.category(self.data[self.j]) in self.IDENT_PART_CATEGORIES:
-            self.j += 1
+        while (j < self.length and self.data[j] >= '\x80' and
+               unicodedata.category(self.data[j]) in self.IDENT_PART_CATEGORIES):
+            j = match(self.data, j + 1).end()
+
+        self.j = j
+
+        return self.identifier_type(self.data[self.i:self.j])
 
-        ident = self.data[self.i:self.j]
+    def identifier_type(self, ident):
         if ident in Keyword.VALUES:
             token_type = Keyword
 
@@ -429,9 +535,21 @@ class JavaTokenizer(object):
         return token_type
 
     def pre_tokenize(self):
-        new_data = list()
         data = self.decode_data()
 
+        self.data = data
+        self.length = len(data)
+        self.source = LineIndex(data)
+        self.offset_map = None
+
+        # Nothing to translate, so the input is used as is
+        if '\\u' not in data:
+            return
+
+        new_data = list()
+        new_length = 0
+        offset_map = OffsetMap()
+
         i = 0
         j = 0
         length = len(data)
@@ -457,7 +575,7 @@ class JavaTokenizer(object):
 
                 if c == 'u':
                     state = MARKER_FOUND
-                    new_data.append(data[i:j - 1])
+                    escape_start = j - 1
                 else:
                     state = NONE
 
@@ -465,106 +583,153 @@ class JavaTokenizer(object):
                 c = data[j]
 
                 if c != 'u':
+                    state = NONE
+
                     try:
                         escape_code = int(data[j:j+4], 16)
                     except ValueError:
+                        self.i = escape_start
                         self.error('Invalid unicode escape', data[j:j+4])
 
+                        # Keep the malformed escape as it is
+                        continue
+
+                    new_data.append(data[i:escape_start])
                     new_data.append(six.unichr(escape_code))
+                    new_length += escape_start - i
+                    offset_map.add(new_length, j + 4 - escape_start)
+                    new_length += 1
 
                     i = j + 4
                     j = i
 
-                    state = NONE
-
                     continue
 
             j = j + 1
 
         new_data.append(data[i:])
 
+        self.i = 0
         self.data = ''.join(new_data)
         self.length = len(self.data)
+        self.offset_map = offset_map
 
-    def tokenize(self):
-        self.reset()
+    def read_token(self):
+        """ Read the token starting at the current offset.
 
-        # Convert unicode escapes
-        # sm: This doesn't seem to help my particular use cases.
-        self.pre_tokenize()
+        Returns the token type with self.j set to the end of the token, or None
+        if nothing was produced (whitespace, comments and unprocessable
+        characters), in which case self.i has already been advanced.
 
-        while self.i < self.length:
-            token_type = None
+        """
 
-            c = self.data[self.i]
-            c_next = None
-            startswith = c
+        c = self.data[self.i]
+        c_next = None
+        startswith = c
 
-            if self.i + 1 < self.length:
-                c_next = self.data[self.i + 1]
-                startswith = c + c_next
+        if self.i + 1 < self.length:
+            c_next = self.data[self.i + 1]
+            startswith = c + c_next
 
-            if c.isspace():
-                self.consume_whitespace()
-                continue
+        if c.isspace():
+            self.consume_whitespace()
+            return None
 
-            elif startswith in ("//", "/*"):
-                comment = self.read_comment()
-                if comment.startswith("/**"):
-                    self.javadoc = comment
-                continue
+        elif startswith in ("//", "/*"):
+            comment = self.read_comment()
+            if comment.startswith("/**"):
+                self.javadoc = comment
+            return None
 
-            elif startswith == '..' and self.try_operator():
-                # Ensure we don't mistake a '...' operator as a sequence of
-                # three '.' separators. This is done as an optimization instead
-                # of moving try_operator higher in the chain because operators
-                # aren't as common and try_operator is expensive
-                token_type = Operator
+        elif c == '@':
+            self.j = self.i + 1
+            return Annotation
 
-            elif c == '@':
-                token_type = Annotation
-                self.j = self.i + 1
+        elif c == '.' and c_next and c_next.isdigit():
+            return self.read_decimal_float_or_integer()
 
-            elif c == '.' and c_next and c_next.isdigit():
-                token_type = self.read_decimal_float_or_integer()
+        elif c in self.SYMBOL_TRIE:
+            # Longest match, so '...' is never mistaken for three separators
+            return self.read_symbol()
 
-            elif self.try_separator():
-                token_type = Separator
+        elif c in ("'", '"'):
+            self.read_string()
+            return String
 
-            elif c in ("'", '"'):
-                token_type = String
-                self.read_string()
+        elif c in '0123456789':
+            return self.read_integer_or_float(c, c_next)
 
-            elif c in '0123456789':
-                token_type = self.read_integer_or_float(c, c_next)
+        elif self.is_java_identifier_start(c):
+            return self.read_identifier()
 
-            elif self.is_java_identifier_start(c):
-                token_type = self.read_identifier()
+        else:
+            self.error('Could not process token', c)
+            self.i = self.i + 1
+            return None
 
-            elif self.try_operator():
-                token_type = Operator
+    def scan(self):
+        """ Return a generator of (token type, start, end, javadoc) tuples, one
+        per token, without building JavaToken objects. Offsets index into
+        self.data; self.offset_map translates them to the original input when
+        it contained unicode escapes.
 
-            else:
-                self.error('Could not process token', c)
-                self.i = self.i + 1
+        """
+
+        self.reset()
+
+        # Convert unicode escapes
+        # sm: This doesn't seem to help my particular use cases.
+        self.pre_tokenize()
+
+        return self.read_tokens()
+
+    def read_tokens(self):
+        while self.i < self.length:
+            token_type = self.read_token()
+
+            if token_type is None:
                 continue
 
-            position = Position(self.current_line, self.i - self.start_of_line)
-            token = token_type(self.data[self.i:self.j], position, self.javadoc)
-            yield token
+            yield (token_type, self.i, self.j, self.javadoc)
 
             if self.javadoc:
                 self.javadoc = None
 
             self.i = self.j
 
+    def tokenize(self):
+        records = self.scan()
+        data = self.data
+        source = self.source
+
+        if self.offset_map is None:
+            for token_type, start, end, javadoc in records:
+                yield token_type(data[start:end], None, javadoc, start, end, source)
+        else:
+            original = self.offset_map.original
+            for token_type, start, end, javadoc in records:
+                yield token_type(data[start:end], None, javadoc,
+                                 original(start), original(end), source)
+
+    def tokenize_compact(self):
+        stream = CompactTokenStream()
+        stream.extend(self.scan())
+        stream.data = self.data
+        stream.source = self.source
+        stream.offset_map = self.offset_map
+        return stream
+
     def error(self, message, char=None):
         # Provide additional information in the errors message
         line_start = self.data.rfind('\n', 0, self.i) + 1
         line_end = self.data.find('\n', self.i)
         line = self.data[line_start:line_end].strip()
 
-        line_number = self.current_line
+        offset = self.i
+        if self.offset_map is not None:
+            offset = self.offset_map.original(offset)
+
+        line_number = self.source.position(offset).line
 
         if not char:
             char = self.data[self.j]
@@ -576,10 +741,281 @@ class JavaTokenizer(object):
         if not self.ignore_errors:
             raise error
 
-def tokenize(code, ignore_errors=False):
-    tokenizer = JavaTokenizer(code, ignore_errors)
+class RegexJavaTokenizer(JavaTokenizer):
+    """ Tokenizer which classifies the common tokens with a single compiled
+    alternation instead of the if/elif chain of JavaTokenizer.read_token.
+
+    Anything the master pattern does not recognise as a complete, well formed
+    token (numbers, non-ASCII identifiers, malformed literals, unterminated
+    comments) is handed to JavaTokenizer.read_token, so both engines produce
+    identical tokens, positions and errors.
+
+    """
+
+    KEYWORD_TYPES = dict([(v, Keyword) for v in Keyword.VALUES] +
+                         [(v, Modifier) for v in Modifier.VALUES] +
+                         [(v, BasicType) for v in BasicType.VALUES] +
+                         [(v, Boolean) for v in Boolean.VALUES] +
+                         [('null', Null)])
+
+    STRING_BODY = r'[^%(d)s\\]*(?:\\[btnfru"\'\\0-7][^%(d)s\\]*)*'
+
+    # Leading whitespace is folded into every match; the token itself starts
+    # at the start of the matched group
+    TOKEN_PATTERN = re.compile(r"""
+        \s*(?:
+        (?P<identifier>[A-Za-z_$][A-Za-z0-9_$]*)(?![A-Za-z0-9_$]|[^\x00-\x7f])
+      | (?P<comment>//[^\n]*\n?|/\*.*?\*/)
+      | (?P<string>"%s"|'%s')
+      | (?P<annotation>@)
+      | (?P<fallback>\.?[0-9]|\.[^\x00-\x7f]|/[*/]|["'])
+      | (?P<symbol>%s)
+        )
+    """ % (STRING_BODY % {'d': '"'},
+           STRING_BODY % {'d': "'"},
+           '|'.join(re.escape(v) for v in
+                    sorted(JavaTokenizer.SYMBOL_TYPES, key=len, reverse=True))),
+        re.VERBOSE | re.DOTALL)
+
+    def read_tokens(self):
+        data = self.data
+        length = self.length
+        match = self.TOKEN_PATTERN.match
+        symbol_types = self.SYMBOL_TYPES
+        keyword_types = self.KEYWORD_TYPES
+
+        while self.i < length:
+            m = match(data, self.i)
+            kind = m and m.lastgroup
+
+            if kind is None or kind == 'fallback':
+                if kind:
+                    self.i = m.start(kind)
+                token_type = JavaTokenizer.read_token(self)
+
+                if token_type is None:
+                    continue
+
+            else:
+                self.i = m.start(kind)
+
+                if kind == 'comment':
+                    comment = m.group(kind)
+                    if comment.startswith("/**"):
+                        self.javadoc = comment
+                    self.i = m.end()
+                    continue
+
+                self.j = m.end()
+
+                if kind == 'identifier':
+                    token_type = keyword_types.get(m.group(kind), Identifier)
+                elif kind == 'symbol':
+                    token_type = symbol_types[m.group(kind)]
+                elif kind == 'string':
+                    token_type = String
+                else:
+                    token_type = Annotation
+
+            yield (token_type, self.i, self.j, self.javadoc)
+
+            if self.javadoc:
+                self.javadoc = None
+
+            self.i = self.j
+
+class CompactTokenStream(object):
+    """ A token stream stored as parallel arrays: a kind code and start and
+    end offsets into data per token. JavaToken objects are only created (and then
+    cached) when indexed, so the stream can be handed to Parser in place of a
+    list of tokens.
+
+    """
+
+    def __init__(self):
+        self.data = None
+        self.source = None
+        self.offset_map = None
+        self.token_types = list()
+        self.kinds = array.array('B')
+        self.starts = array.array('l')
+        self.ends = array.array('l')
+
+        # Javadoc comments are rare, so they are kept by token index
+        self.javadocs = dict()
+
+        self._tokens = None
+
+    def extend(self, records):
+        kind_codes = dict((t, k) for k, t in enumerate(self.token_types))
+
+        for token_type, start, end, javadoc in records:
+            kind = kind_codes.get(token_type)
+
+            if kind is None:
+                kind = kind_codes[token_type] = len(self.token_types)
+                self.token_types.append(token_type)
+
+            if javadoc:
+                self.javadocs[len(self.kinds)] = javadoc
+
+            self.kinds.append(kind)
+            self.starts.append(start)
+            self.ends.append(end)
+
+        self._tokens = None
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __iter__(self):
+        for i in range(len(self.kinds)):
+            yield self[i]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self.kinds)))]
+
+        if self._tokens is None:
+            self._tokens = [None] * len(self.kinds)
+
+        # Raises IndexError past the end, which Parser relies on
+        token = self._tokens[index]
+
+        if token is None:
+            token = self._tokens[index] = self.make_token(index)
+
+        return token
+
+    def make_token(self, index):
+        if index < 0:
+            index += len(self.kinds)
+
+        start = self.starts[index]
+        end = self.ends[index]
+        token_type = self.token_types[self.kinds[index]]
+        value = self.data[start:end]
+
+        if self.offset_map is not None:
+            start = self.offset_map.original(start)
+            end = self.offset_map.original(end)
+
+        return token_type(value, None, self.javadocs.get(index), start, end,
+                          self.source)
+
+ENGINES = {
+    'default': JavaTokenizer,
+    'regex': RegexJavaTokenizer,
+}
+
+def get_tokenizer(code, ignore_errors=False, engine='default'):
+    try:
+        tokenizer_class = ENGINES[engine]
+    except KeyError:
+        raise ValueError('Unknown tokenizer engine %r' % (engine,))
+
+    return tokenizer_class(code, ignore_errors)
+
+def tokenize(code, ignore_errors=False, engine='default'):
+    tokenizer = get_tokenizer(code, ignore_errors, engine)
     return tokenizer.tokenize()
 
+def tokenize_compact(code, ignore_errors=False, engine='default'):
+    tokenizer = get_tokenizer(code, ignore_errors, engine)
+    return tokenizer.tokenize_compact()
+
+def tokenize_span(source, start, end, engine='default'):
+    """ Return the tokens of the text of source, a LineIndex, from offset start
+    up to end. Their offsets and positions are those in the whole text. The
+    span is read again from text which was tokenized before, so any errors
+    in it were ignored then as well.
+
+    """
+
+    tokenizer = get_tokenizer(source.data[start:end], True, engine)
+
+    for token in tokenizer.tokenize():
+        token.offset += start
+        token.end += start
+        token.source = source
+        yield token
+
+Edit = namedtuple('Edit', ['offset', 'deleted', 'inserted'])
+
+def retokenize(tokens, edit, code, ignore_errors=False, engine='default'):
+    """ Return the tokens of code, the text produced by applying edit to the
+    text tokens were read from. Lexing restarts at the last token before the
+    edit and stops as soon as the new tokens line up with the old ones again.
+    The old tokens before and after that span are copied rather than lexed
+    again, those after it with their offsets moved by the edit. tokens itself
+    is left unchanged and still describes the old text.
+
+    Lexing takes time in proportion to the edited span, but copying the other
+    tokens takes time in proportion to the whole list, though far less than
+    lexing it would.
+
+    """
+
+    tokenizer = get_tokenizer(code, ignore_errors, engine)
+    tokenizer.reset()
+    tokenizer.pre_tokenize()
+
+    # Unicode escapes make offsets in the edited text ambiguous, start over
+    if tokenizer.offset_map is not None:
+        return list(tokenize(code, ignore_errors, engine))
+
+    delta = len(edit.inserted) - edit.deleted
+    edit_end = edit.offset + len(edit.inserted)
+
+    # First token that ends at or after the edit
+    low, high = 0, len(tokens)
+    while low < high:
+        mid = (low + high) // 2
+        if tokens[mid].end < edit.offset:
+            low = mid + 1
+        else:
+            high = mid
+    k = low
+
+    # Symbols and numbers may look ahead into an adjacent token, so restart
+    # after whitespace or a comment
+    while 0 < k < len(tokens) and tokens[k - 1].end == tokens[k].offset:
+        k -= 1
+
+    tokenizer.i = tokens[k - 1].end if k else 0
+
+    data = tokenizer.data
+    source = tokenizer.source
+    new_tokens = list()
+    m = k
+
+    for token_type, start, end, javadoc in tokenizer.read_tokens():
+        if start >= edit_end:
+            old_start = start - delta
+
+            while m < len(tokens) and tokens[m].offset < old_start:
+                m += 1
+
+            if m < len(tokens):
+                old = tokens[m]
+                if (old.offset == old_start and old.end == end - delta and
+                    type(old) is token_type and old.javadoc == javadoc):
+                    break
+
+        new_tokens.append(token_type(data[start:end], None, javadoc, start, end, source))
+    else:
+        m = len(tokens)
+
+    # Positions before the edit stay valid, those after it are resolved again
+    head = [type(token)(token.value, token._position, token.javadoc,
+                        token.offset, token.end, source)
+            for token in tokens[:k]]
+    tail = [type(token)(token.value, None, token.javadoc,
+                        token.offset + delta, token.end + delta, source)
+            for token in tokens[m:]]
+
+    return head + new_tokens + tail
+
 def reformat_tokens(tokens):
     indent = 0
     closed_block = False
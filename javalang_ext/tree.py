@@ -5,18 +5,28 @@ from .ast import Node
 
 class CompilationUnit(Node):
     attrs = ("package", "imports", "types")
+    attr_types = {"package": ("PackageDeclaration",), "imports": ("Import",),
+                  "types": ("TypeDeclaration",)}
+    # _index holds the TreeIndex of index_tree()
+    __slots__ = ("package", "imports", "types", "_index")
 
 class Import(Node):
     attrs = ("path", "static", "wildcard")
+    attr_types = {"path": (), "static": (), "wildcard": ()}
 
 class Documented(Node):
     attrs = ("documentation",)
+    attr_types = {"documentation": ()}
+    __slots__ = ()
 
 class Declaration(Node):
     attrs = ("modifiers", "annotations")
+    attr_types = {"modifiers": (), "annotations": ("Annotation",)}
+    __slots__ = ()
 
 class TypeDeclaration(Declaration, Documented):
     attrs = ("name", "body")
+    attr_types = {"name": ()}
 
     @property
     def fields(self):
@@ -32,12 +42,16 @@ class TypeDeclaration(Declaration, Documented):
 
 class PackageDeclaration(Declaration, Documented):
     attrs = ("name",)
+    attr_types = {"name": ()}
 
 class ClassDeclaration(TypeDeclaration):
     attrs = ("type_parameters", "extends", "implements")
+    attr_types = {"type_parameters": ("TypeParameter",), "extends": ("Type",),
+                  "implements": ("Type",)}
 
 class EnumDeclaration(TypeDeclaration):
     attrs = ("implements",)
+    attr_types = {"implements": ("Type",)}
 
     @property
     def fields(self):
@@ -49,6 +63,7 @@ class EnumDeclaration(TypeDeclaration):
 
 class InterfaceDeclaration(TypeDeclaration):
     attrs = ("type_parameters", "extends",)
+    attr_types = {"type_parameters": ("TypeParameter",), "extends": ("Type",)}
 
 class AnnotationDeclaration(TypeDeclaration):
     attrs = ()
@@ -57,28 +72,34 @@ class AnnotationDeclaration(TypeDeclaration):
 
 class Type(Node):
     attrs = ("name", "dimensions",)
+    attr_types = {"name": (), "dimensions": ()}
 
 class BasicType(Type):
     attrs = ()
 
 class ReferenceType(Type):
     attrs = ("arguments", "sub_type")
+    attr_types = {"arguments": ("TypeArgument",), "sub_type": ("ReferenceType",)}
 
 class TypeArgument(Node):
     attrs = ("type", "pattern_type")
+    attr_types = {"type": ("Type",), "pattern_type": ()}
 
 # ------------------------------------------------------------------------------
 
 class TypeParameter(Node):
     attrs = ("name", "extends")
+    attr_types = {"name": (), "extends": ("ReferenceType",)}
 
 # ------------------------------------------------------------------------------
 
 class Annotation(Node):
     attrs = ("name", "element")
+    attr_types = {"name": ()}
 
 class ElementValuePair(Node):
     attrs = ("name", "value")
+    attr_types = {"name": ()}
 
 class ElementArrayValue(Node):
     attrs = ("values",)
@@ -87,15 +108,21 @@ class ElementArrayValue(Node):
 
 class Member(Documented):
     attrs = ()
+    __slots__ = ()
 
 class MethodDeclaration(Member, Declaration):
     attrs = ("type_parameters", "return_type", "name", "parameters", "throws", "body")
+    attr_types = {"type_parameters": ("TypeParameter",), "return_type": ("Type",),
+                  "name": (), "parameters": ("FormalParameter",), "throws": ()}
 
 class FieldDeclaration(Member, Declaration):
     attrs = ("type", "declarators")
+    attr_types = {"type": ("Type",), "declarators": ("VariableDeclarator",)}
 
 class ConstructorDeclaration(Declaration, Documented):
     attrs = ("type_parameters", "name", "parameters", "throws", "body")
+    attr_types = {"type_parameters": ("TypeParameter",), "name": (),
+                  "parameters": ("FormalParameter",), "throws": ()}
 
 # ------------------------------------------------------------------------------
 
@@ -107,23 +134,28 @@ class ArrayInitializer(Node):
 
 class VariableDeclaration(Declaration):
     attrs = ("type", "declarators")
+    attr_types = {"type": ("Type",), "declarators": ("VariableDeclarator",)}
 
 class LocalVariableDeclaration(VariableDeclaration):
     attrs = ()
 
 class VariableDeclarator(Node):
     attrs = ("name", "dimensions", "initializer")
+    attr_types = {"name": (), "dimensions": ()}
 
 class FormalParameter(Declaration):
     attrs = ("type", "name", "varargs")
+    attr_types = {"type": ("Type",), "name": (), "varargs": ()}
 
 class InferredFormalParameter(Node):
     attrs = ('name',)
+    attr_types = {"name": ()}
 
 # ------------------------------------------------------------------------------
 
 class Statement(Node):
     attrs = ("label",)
+    attr_types = {"label": ()}
 
 class IfStatement(Statement):
     attrs = ("condition", "then_statement", "else_statement")
@@ -142,9 +174,11 @@ class AssertStatement(Statement):
 
 class BreakStatement(Statement):
     attrs = ("goto",)
+    attr_types = {"goto": ()}
 
 class ContinueStatement(Statement):
     attrs = ("goto",)
+    attr_types = {"goto": ()}
 
 class ReturnStatement(Statement):
     attrs = ("expression",)
@@ -171,12 +205,15 @@ class StatementExpression(Statement):
 
 class TryResource(Declaration):
     attrs = ("type", "name", "value")
+    attr_types = {"type": ("Type",), "name": ()}
 
 class CatchClause(Statement):
     attrs = ("parameter", "block")
+    attr_types = {"parameter": ("CatchClauseParameter",)}
 
 class CatchClauseParameter(Declaration):
     attrs = ("types", "name")
+    attr_types = {"types": (), "name": ()}
 
 # ------------------------------------------------------------------------------
 
@@ -193,21 +230,27 @@ class EnhancedForControl(Node):
 
 class Expression(Node):
     attrs = ()
+    # Set by the parser on expressions in parentheses as well as on primaries
+    __slots__ = ("prefix_operators", "postfix_operators", "selectors")
 
 class Assignment(Expression):
     attrs = ("expressionl", "value", "type")
+    attr_types = {"type": ()}
 
 class TernaryExpression(Expression):
     attrs = ("condition", "if_true", "if_false")
 
 class BinaryOperation(Expression):
     attrs = ("operator", "operandl", "operandr")
+    attr_types = {"operator": ()}
 
 class Cast(Expression):
     attrs = ("type", "expression")
+    attr_types = {"type": ("Type",)}
 
 class MethodReference(Expression):
     attrs = ("expression", "method", "type_arguments")
+    attr_types = {"type_arguments": ("TypeArgument",)}
 
 class LambdaExpression(Expression):
     attrs = ('parameters', 'body')
@@ -216,18 +259,22 @@ class LambdaExpression(Expression):
 
 class Primary(Expression):
     attrs = ("prefix_operators", "postfix_operators", "qualifier", "selectors")
+    attr_types = {"prefix_operators": (), "postfix_operators": (), "qualifier": ()}
 
 class Literal(Primary):
     attrs = ("value",)
+    attr_types = {"value": ()}
 
 class This(Primary):
     attrs = ()
 
 class MemberReference(Primary):
     attrs = ("member",)
+    attr_types = {"member": ()}
 
 class Invocation(Primary):
     attrs = ("type_arguments", "arguments")
+    attr_types = {"type_arguments": ("TypeArgument",)}
 
 class ExplicitConstructorInvocation(Invocation):
     attrs = ()
@@ -237,18 +284,22 @@ class SuperConstructorInvocation(Invocation):
 
 class MethodInvocation(Invocation):
     attrs = ("member",)
+    attr_types = {"member": ()}
 
 class SuperMethodInvocation(Invocation):
     attrs = ("member",)
+    attr_types = {"member": ()}
 
 class SuperMemberReference(Primary):
     attrs = ("member",)
+    attr_types = {"member": ()}
 
 class ArraySelector(Expression):
     attrs = ("index",)
 
 class ClassReference(Primary):
     attrs = ("type",)
+    attr_types = {"type": ("Type",)}
 
 class VoidClassReference(ClassReference):
     attrs = ()
@@ -257,15 +308,18 @@ class VoidClassReference(ClassReference):
 
 class Creator(Primary):
     attrs = ("type",)
+    attr_types = {"type": ("Type",)}
 
 class ArrayCreator(Creator):
     attrs = ("dimensions", "initializer")
 
 class ClassCreator(Creator):
     attrs = ("constructor_type_arguments", "arguments", "body")
+    attr_types = {"constructor_type_arguments": ("TypeArgument",)}
 
 class InnerClassCreator(Creator):
     attrs = ("constructor_type_arguments", "arguments", "body")
+    attr_types = {"constructor_type_arguments": ("TypeArgument",)}
 
 # ------------------------------------------------------------------------------
 
@@ -274,7 +328,9 @@ class EnumBody(Node):
 
 class EnumConstantDeclaration(Declaration, Documented):
     attrs = ("name", "arguments", "body")
+    attr_types = {"name": ()}
 
-class AnnotationMethod(Declaration):
+class AnnotationMethod(Declaration, Documented):
     attrs = ("name", "return_type", "dimensions", "default")
+    attr_types = {"name": (), "return_type": ("Type",), "dimensions": ()}
 
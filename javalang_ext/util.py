@@ -87,9 +87,41 @@ class LookAheadIterator(object):
             # If there are not more markers in the stack then discard the values
             pass
 
+class LazyList(object):
+    """ An indexable view of an iterable which only reads values from it as
+    far as they have been indexed. Negative indices read it to the end.
+
+    """
+
+    def __init__(self, iterable):
+        self.iterable = iter(iterable)
+        self.values = list()
+
+    def __len__(self):
+        self.values.extend(self.iterable)
+        return len(self.values)
+
+    def __getitem__(self, index):
+        values = self.values
+
+        if index < 0:
+            values.extend(self.iterable)
+
+        while len(values) <= index:
+            try:
+                values.append(next(self.iterable))
+            except StopIteration:
+                break
+
+        return values[index]
+
 class LookAheadListIterator(object):
     def __init__(self, iterable):
-        self.list = list(iterable)
+        # Indexable sequences (lists, CompactTokenStream) are used as is
+        if hasattr(iterable, '__getitem__'):
+            self.list = iterable
+        else:
+            self.list = list(iterable)
 
         self.marker = 0
         self.saved_markers = []
@@ -160,6 +192,4 @@ class LookAheadListIterator(object):
 
         if reset:
             self.marker = saved
-        elif self.saved_markers:
-            self.saved_markers[-1] = saved
 
@@ -31,7 +31,7 @@ The `javalang-ext` library builds upon javalang and adds quality-of-life updates
 
 """,
     zip_safe = False,
-    install_requires = ['six',],
+    install_requires = ['six', 'futures; python_version < "3"'],
     tests_require = ["nose",],
     test_suite = "nose.collector",
 )